@@ -1,14 +1,36 @@
+import atexit
+import contextlib
+import filecmp
+import hashlib
+import itertools
+import json
 import os
+import queue
 import re
 import shutil
+import signal
 import subprocess
 import tempfile
+import threading
 import time
+import tracemalloc
 from pathlib import Path
 
 # We define a list of image formats that are supported by LaTeX
 image_formats = [".png", ".jpg", ".jpeg", ".gif", ".bmp", ".eps"]
 
+# Add the specifications for platformdirs
+appname = "Obsidian2LaTeX"
+appauthor = "Itron al Lenn"
+
+# We define the paths to the programs that convert the excalidraw drawings
+excalidraw_export_path = rf"C:\Users\{os.getenv('username')}\AppData\Roaming\npm\excalidraw_export.cmd"
+inkscape_path = r"C:\Program Files\Inkscape\bin\inkscape.exe"
+
+# The version of the converter is part of the key of the result cache
+# It has to be increased whenever the conversion creates a different output
+converter_version = "7"
+
 # We define a list of metadata that we want to use
 important_metadata = ["title", "author", "date"]
 
@@ -26,291 +48,1807 @@ math_environments = [
 ]
 
 
-# We define a list subclass called lines that has a method to convert the list to a string
-# It also has a method to get an boolean value if the specific item in the list starts with "$$"
-class Lines(list):
-    def __str__(self):
-        return "\n".join(self)
+# We define the regular expressions that are used while streaming the lines
+excalidraw_pattern = re.compile(r"\!\[\[.*\.excalidraw.*\]\]")
+image_pattern = re.compile("|".join(re.escape(i) for i in image_formats))
+table_comp_point_pattern = re.compile(r"-+[: ]*\|")
+line_end_pattern = re.compile(r"[\w.\$]")
+image_end_pattern = re.compile(r"(\|.*)*\]\]")
+excalidraw_start_pattern = re.compile(r"\!\[\[(.*\/)?")
+excalidraw_end_pattern = re.compile(r"(\|[^\]]*)?\]\]")
+whitespace_pattern = re.compile(r"[\s]{2,}")
+
+# We define the tokens that are rewritten in the text and the LaTeX that replaces them
+# Replaces \pu with the LaTeX compatible \si, {align} with {align*} and escapes the & outside of math
+inline_replacements = {
+    "\\pu": "\\si",
+    "{align}": "{align*}",
+    "&": "\\&",
+}
+inline_pattern = re.compile(r"\*\*|_|\\pu|\{align\}|(?<!\\)&")
+math_inline_pattern = re.compile(r"\\pu|\{align\}")
+
+# We define the inline math of a line, "$$...$$" is checked first so that it isn't read as two empty "$...$"
+math_span_pattern = re.compile(r"(?<!\\)\$\$.+?(?<!\\)\$\$|(?<!\\)\$[^$]+?(?<!\\)\$")
+
+# We define the unicode symbols that are replaced in the text
+# The dictionaries can be extended, the translate table is built once from all of them
+special_characters = {
+    "≤": "<=",
+    "≥": ">=",
+    "≠": "!=",
+    "→": "->",
+    "#": "\\#",
+}
+
+# In math the special characters are replaced with math symbols and "#" is left as it is
+math_characters = {
+    "≤": "\\leq ",
+    "≥": "\\geq ",
+    "≠": "\\neq ",
+    "→": "\\rightarrow ",
+}
+
+greek_letters = {
+    "α": "\\alpha",
+    "β": "\\beta",
+    "γ": "\\gamma",
+    "δ": "\\delta",
+    "ε": "\\epsilon",
+    "ζ": "\\zeta",
+    "η": "\\eta",
+    "θ": "\\theta",
+    "ι": "\\iota",
+    "κ": "\\kappa",
+    "λ": "\\lambda",
+    "μ": "\\mu",
+    "ν": "\\nu",
+    "ξ": "\\xi",
+    "π": "\\pi",
+    "ρ": "\\rho",
+    "σ": "\\sigma",
+    "τ": "\\tau",
+    "υ": "\\upsilon",
+    "φ": "\\phi",
+    "χ": "\\chi",
+    "ψ": "\\psi",
+    "ω": "\\omega",
+    "Γ": "\\Gamma",
+    "Δ": "\\Delta",
+    "Θ": "\\Theta",
+    "Λ": "\\Lambda",
+    "Ξ": "\\Xi",
+    "Π": "\\Pi",
+    "Σ": "\\Sigma",
+    "Υ": "\\Upsilon",
+    "Φ": "\\Phi",
+    "Ψ": "\\Psi",
+    "Ω": "\\Omega",
+}
+
+arrows = {
+    "←": "\\leftarrow",
+    "↔": "\\leftrightarrow",
+    "⇒": "\\Rightarrow",
+    "⇐": "\\Leftarrow",
+    "⇔": "\\Leftrightarrow",
+    "↦": "\\mapsto",
+    "↑": "\\uparrow",
+    "↓": "\\downarrow",
+}
+
+
+def build_symbol_table(math=False):
+    # Greek letters and arrows work in text and in math, so we wrap them in \ensuremath
+    table = {key: "\\ensuremath{" + value + "}" for key, value in (greek_letters | arrows).items()}
+    table.update(math_characters if math else special_characters)
+    return str.maketrans(table)
+
+
+symbol_table = build_symbol_table()
+math_symbol_table = build_symbol_table(math=True)
+
+# We define the LaTeX snippets that surround images and drawings
+figure_start = "\\begin{figure}[H]\n\\includegraphics[width=0.5\\textwidth]{"
+figure_end = "}\n\\centering\n\\end{figure}"
+table_start = "\\begin{table}[H]\n\\centering\n\\begin{tabular}{"
+table_end = "\n\\end{tabular}\n\\end{table}"
+longtable_start = "\\begin{longtable}{"
+longtable_end = "\n\\end{longtable}"
+
+
+# We define functions that get an boolean value if a line starts a specific element
+# The kind of a line is found with rules, which are registered by the first character of the line
+# So a line is classified with one lookup and only the few rules for its first character are checked
+line_rules = {}
+
+
+def add_line_rule(kind, start, pattern=None):
+    # A rule matches if the line starts with the start string and the precompiled pattern, if there is one, matches too
+    # The rules are checked in the order they were added, so a longer start has to be added before a shorter one
+    line_rules.setdefault(start[0], []).append((kind, start, re.compile(pattern) if pattern is not None else None))
+
+
+def classify(line):
+    # We return the kind of the line, a line of normal text has no kind
+    if not line:
+        return None
+    for kind, start, pattern in line_rules.get(line[0], ()):
+        if line.startswith(start) and (pattern is None or pattern.match(line)):
+            return kind
+    return None
+
+
+add_line_rule("fence", "```")
+add_line_rule("math", "$$")
+add_line_rule("subsubheader", "###")
+add_line_rule("subheader", "##")
+add_line_rule("header", "#")
+add_line_rule("align", "\\", r"\\(begin|end)\{(" + "|".join(re.escape(i) for i in math_environments) + r")\}")
+add_line_rule("embed", "![[", r"!\[\[[^\]]+\]\]\s*$")
+
+# Embeds of these files are shown as links and not transcluded like notes
+embedded_file_formats = [".pdf", ".svg", ".mp3", ".mp4", ".webm", ".wav", ".ogg", ".canvas"]
+
+# The headers are replaced with these LaTeX commands, the marker is removed from the line
+header_commands = {
+    "header": ("section", "# "),
+    "subheader": ("subsection", "## "),
+    "subsubheader": ("subsubsection", "### "),
+}
+
+
+def embedded_note(line):
+    # We return the name and the heading of the note which is embedded in the line, images and drawings are no notes
+    target = line.strip()[3:-2].partition("|")[0]
+    name, _, heading = target.partition("#")
+    if not name or image_pattern.search(name) or ".excalidraw" in name:
+        return None
+    if Path(name).suffix.lower() in embedded_file_formats:
+        return None
+    return (name if name.endswith(".md") else name + ".md"), heading
+
+
+def heading_section(lines, heading):
+    # We return the lines from the heading to the next header of the same or a higher level
+    level = None
+    section = []
+    for line in lines:
+        if classify(line) in header_commands:
+            line_level = len(line) - len(line.lstrip("#"))
+            if level is None and line.lstrip("#").strip() == heading.strip():
+                level = line_level
+            elif level is not None and line_level <= level:
+                break
+        if level is not None:
+            section.append(line)
+    return section
+
+
+def needs_line_break(line):
+    # A line which ends with a word character, a dot or a "$" gets a line break
+    # We only check the last character which is not whitespace instead of searching the whole line
+    stripped = line.rstrip()
+    return stripped != "" and line_end_pattern.match(stripped[-1]) is not None
+
+
+def is_table_comp_point(line):
+    return line is not None and table_comp_point_pattern.search(line) is not None
+
+
+def is_table_row(line):
+    return line is not None and line.endswith("|")
+
+
+def table_alignment(line):
+    # We read the alignment of the columns from the markers, a column without ":" is centered
+    cells = line.strip()
+    cells = cells[1:] if cells.startswith("|") else cells
+    cells = cells[:-1] if cells.endswith("|") else cells
+    alignment = []
+    for i in cells.split("|"):
+        i = i.strip()
+        if i.startswith(":") and not i.endswith(":"):
+            alignment.append("l")
+        elif i.endswith(":") and not i.startswith(":"):
+            alignment.append("r")
+        else:
+            alignment.append("c")
+    return "|".join(alignment)
+
+
+def split_sections(pairs):
+    # We split the pairs of lines before every header
+    section = []
+    for pair in pairs:
+        if section and pair[0].startswith("#") and classify(pair[0]) in header_commands:
+            yield section
+            section = []
+        section.append(pair)
+    if section:
+        yield section
+
+
+def lookahead(lines):
+    # We yield every line of an iterable together with the line after it
+    # The lines of a file still contain the newline character, so we strip it
+    iterator = iter(lines)
+    current = next(iterator, None)
+    for following in iterator:
+        following = following.rstrip("\n")
+        yield current.rstrip("\n"), following
+        current = following
+    if current is not None:
+        yield current.rstrip("\n"), None
+
+
+def math_spans(line):
+    # We return the start and end of every inline math in the line, a line without "$" has none
+    if "$" not in line:
+        return []
+    return [match.span() for match in math_span_pattern.finditer(line)]
+
+
+def rewrite_inline(chunk, spans=(), emphasis=None):
+    # We remember the position of the last "_ " in the chunk, because an italic text can only start before it
+    # The emphasis holds if a bold and an italic text are open, so that they can go over several lines of a paragraph
+    # Its last value says if the paragraph goes on after the chunk, then an italic text can end on a later line
+    last_italic_end = chunk.rfind("_ ")
+    bold, italic, continues = emphasis or (False, False, False)
+    parts = []
+
+    # The spans split the chunk into text and math, so the boundaries alternate between a text and a math
+    boundaries = [0]
+    for span in spans:
+        boundaries.extend(span)
+    boundaries.append(len(chunk))
+
+    for index in range(len(boundaries) - 1):
+        segment_start = boundaries[index]
+        segment_end = boundaries[index + 1]
+
+        # In math only \pu and {align} are replaced, emphasis, "&" and "#" belong to the formula
+        if index % 2:
+            segment = chunk[segment_start:segment_end]
+            segment = math_inline_pattern.sub(lambda match: inline_replacements[match.group()], segment)
+            parts.append(segment.translate(math_symbol_table))
+            continue
+
+        # We go once through all tokens in the text and replace them depending on the state before
+        text_parts = []
+        position = segment_start
+        for match in inline_pattern.finditer(chunk, segment_start, segment_end):
+            token = match.group()
+            start = match.start()
+
+            if token == "**":
+                # We replace ** either with \\textbf{ or } depending on if it is the first or second
+                replacement = "}" if bold else "\\textbf{"
+                bold = not bold
+
+            elif token == "_":
+                # We replace _ either with \\textit{ or } depending on if it is the first or second
+                # unless it is followed by a {
+                following = chunk[start + 1 : start + 2]
+                if italic and following == " ":
+                    replacement = "}"
+                    italic = False
+                elif not italic and following not in ("{", "") and (start <= last_italic_end or continues):
+                    replacement = "\\textit{"
+                    italic = True
+                else:
+                    continue
 
-    def is_math(self, index):
-        return self[index].startswith("$$")
+            else:
+                replacement = inline_replacements[token]
 
-    def is_header(self, index):
-        return self[index].startswith("#") and not self[index].startswith("##")
+            text_parts.append(chunk[position:start])
+            text_parts.append(replacement)
+            position = match.end()
 
-    def is_subheader(self, index):
-        return self[index].startswith("##") and not self[index].startswith("###")
+        text_parts.append(chunk[position:segment_end])
 
-    def is_subsubheader(self, index):
-        return self[index].startswith("###")
+        # Replace parameter characters and unicode symbols with the LaTeX compatible ones
+        parts.append("".join(text_parts).translate(symbol_table))
 
-    def is_align(self, index):
-        for i in math_environments:
-            if self[index].startswith("\\begin{" + i + "}") or self[index].startswith("\\end{" + i + "}"):
-                return True
-        else:
-            return False
-
-    def has_metadata(self):
-        if self[0].startswith("---"):
-            # Find the end of the metadata
-            for i in range(1, len(self)):
-                if self[i].startswith("---"):
-                    return True, i
-            return False, None
-        else:
-            return False, None
+    if emphasis is not None:
+        emphasis[:2] = [bold, italic]
+    return "".join(parts)
 
-    def has_image(self, index):
-        for i in image_formats:
-            if i in self[index]:
-                return True
 
-    def has_excalidraw(self, index):
-        if re.search(r"\!\[\[.*\.excalidraw(|.*)*\]\]", self[index]):
-            return True
+def rewrite_math(chunk):
+    # The whole chunk is math
+    return rewrite_inline(chunk, [(0, len(chunk))])
 
-    def start_json(self, index):
-        return self[index].startswith("```json")
 
-    def end_json(self, index):
-        return self[index].startswith("```")
+class ConversionStream:
+    """This streams the LaTeX conversion of a note line by line.
 
-    def is_chem(self, index):
-        return "\\ce" in self[index]
+    Iterating over the stream yields LaTeX chunks which can be written straight to a file.
+    The metadata and the names of the images and drawings are collected while iterating.
+    """
 
-    def is_table_comp_point(self, index):
-        return re.search(r"-+[: ]*\|", self[index])
+    def __init__(self, lines, behavior, embed=None, sections=None):
+        self.lines = lines
+        self.behavior = behavior
 
+        # The embed function gets the name and heading of an embedded note and the line converted as text
+        # It returns what is written instead of the line, without it embedded notes stay as text
+        self.embed = embed
+        self.embed_count = 0
 
-def convert(text, behavior):
-    # We create a list of the lines in the text
-    lines = Lines((text + "\n").split("\n"))
-
-    # We create a dictionary for the metadata
-    metadata = {}
-
-    # When has_metadata is true we write the relevant metadata to the dictionary
-    has_metadata, end_metadata = lines.has_metadata()
-    if has_metadata:
-        for i in range(1, end_metadata):
-            key, value = lines[i].split(": ")
-            for j in important_metadata:
-                if key == j:
-                    metadata[key] = value
-
-    # If has_metadata is true we delete the metadata
-    if has_metadata:
-        del lines[0 : end_metadata + 1]
-
-    # Handy tools which help us later
-    last_was_end = True
-    image_names = []
-    drawing_names = []
-    del_index = []
-    id_to_check: list = []
-    first_id = 0
-
-    # We loop through the lines
-    for i in range(len(lines)):
-        # Check if the line is a header
-        if lines.is_header(i):
-            # If the line is a header we replace the "#" with the corresponding "\section{}"
-            if behavior["table_of_contents"]:
-                lines[i] = "\\section{" + lines[i].replace("# ", "") + "}"
-            else:
-                lines[i] = "\\section*{" + lines[i].replace("# ", "") + "}"
+        # With a section cache the sections which didn't change since the last conversion are not converted again
+        self.sections = sections
+        self.metadata = {}
+        self.image_names = []
+        self.drawing_names = []
 
-        # Check if the line is a subheader
-        elif lines.is_subheader(i):
-            # If the line is a subheader we replace the "##" with the corresponding "\subsection{}"
-            if behavior["table_of_contents"]:
-                lines[i] = "\\subsection{" + lines[i].replace("## ", "") + "}"
-            else:
-                lines[i] = "\\subsection*{" + lines[i].replace("## ", "") + "}"
+        # Tables with more rows than this are written as a longtable, which can break across pages
+        self.longtable_rows = int(behavior.get("longtable_rows", 50))
 
-        # Check if the line is a subsubheader
-        elif lines.is_subsubheader(i):
-            # If the line is a subsubheader we replace the "###" with the corresponding "\subsubsection{}"
-            if behavior["table_of_contents"]:
-                lines[i] = "\\subsubsection{" + lines[i].replace("### ", "") + "}"
-            else:
-                lines[i] = "\\subsubsection*{" + lines[i].replace("### ", "") + "}"
+    def __iter__(self):
+        # We remember in which block we are, the raw line before the current one and the number of lines
+        self.block = None
+        self.previous = None
+        self.frontmatter = []
+        self.index = 0
 
-        # Check if the line is a math environment
-        elif lines.is_math(i):
-            # If the line one after or before is a align environment we add their index to an list
-            if lines.is_align(i - 1) or lines.is_align(i + 1):
-                del_index.append(i)
-            else:
-                # If the line is a math environment we replace the "$$"
-                # with the corresponding "\\[" and "\\]"
-                if last_was_end:
-                    lines[i] = "\\[" + lines[i].replace("$$", "")
-                else:
-                    lines[i] = lines[i].replace("$$", "") + "\\]"
-            if last_was_end:
-                last_was_end = False
-                first_id = i
-            else:
-                last_was_end = True
-                id_pair: tuple = (first_id, i)
-                id_to_check.append(id_pair)
-
-        elif lines.is_table_comp_point(i):
-            # We get the number of columns
-            columns = lines[i].count("|") - 1
-            # We get the number of rows
-            rows = 0
-            for j in range(i, len(lines)):
-                if lines[j].endswith("|"):
-                    rows += 1
-                else:
-                    break
-            # We create a string with the correct number of columns
-            columns_string = ""
-            for j in range(columns):
-                columns_string += "c|"
-            # We delete the last "|" in the string
-            columns_string = columns_string[:-1]
-            # We get the content of the table
-            row_content = []
-            for j in range(i - 1, i + rows):
-                row_content.append(lines[j].split("|")[1:-1])
-            # We replace multipels of whitespace in the row_content with a single whitespace
-            for key in range(rows + 1):
-                for subkey, k in enumerate(row_content[key]):
-                    new_content = re.sub(r"[\s]{2,}", " ", k, 0, re.MULTILINE)
-                    row_content[key][subkey] = new_content
-
-            # We create the string for the table
-            lines[i - 1] = "\\begin{table}[H]\n\\centering\n\\begin{tabular}{" + columns_string + "}\n"
-            new_content = ""
-            for j in row_content[0]:
-                new_content += j + " & "
-            else:
-                lines[i] = new_content[:-3] + " \\\\ \n\\hline"
+        # The rows of a table are kept until we know if it is short enough for a table float
+        # When the table gets too long, the rows are written as a longtable and the rest is streamed
+        self.table_alignment_spec = None
+        self.table_head = None
+        self.table_rows = None
 
-            for j in range(2, rows + 1):
-                new_content = ""
-                for k in row_content[j]:
-                    new_content += k + " & "
+        # A bold or italic text can go over several lines of a paragraph, so we keep if they are open
+        self.emphasis = [False, False, False]
+        self.following = None
+
+        if self.sections is None:
+            yield from self.convert_lines(lookahead(self.lines))
+        else:
+            yield from self.convert_sections()
+
+        # A fenced block which is not closed at the end of the note is closed here
+        if self.block == "fence":
+            yield "\\end{verbatim}\n"
+
+    def convert_sections(self):
+        # A section which starts and ends outside of a block only depends on its lines and the line after it
+        # So if they didn't change, we use the LaTeX of the last conversion instead of converting the section again
+        for pairs in split_sections(lookahead(self.lines)):
+            key = None
+            first = self.index == 0
+            if self.block is None:
+                key = self.sections.key(pairs, first)
+                entry = self.sections.get(key)
+                if entry is not None:
+                    self.index += len(pairs)
+                    self.metadata.update(entry["metadata"])
+                    self.image_names += entry["image_names"]
+                    self.drawing_names += entry["drawing_names"]
+                    yield entry["latex"]
+                    continue
+
+            # Sections with embedded notes are converted every time, because the embedded notes can change
+            image_count = len(self.image_names)
+            drawing_count = len(self.drawing_names)
+            embed_count = self.embed_count
+            chunks = []
+            for i in self.convert_lines(pairs):
+                chunks.append(i)
+                yield i
+
+            if key is not None and self.block is None and self.embed_count == embed_count:
+                entry = {
+                    "latex": "".join(chunks),
+                    "metadata": dict(self.metadata) if first else {},
+                    "image_names": self.image_names[image_count:],
+                    "drawing_names": self.drawing_names[drawing_count:],
+                }
+                self.sections.put(key, entry)
+
+    def convert_lines(self, pairs):
+        for line, following in pairs:
+            index = self.index
+            self.index += 1
+            self.following = following
+
+            # A note which starts with "---" has a frontmatter block which we read into the metadata dictionary
+            if self.block == "frontmatter" or (index == 0 and line.startswith("---")):
+                self.frontmatter.append(line)
+                if self.block == "frontmatter" and line.startswith("---"):
+                    self.read_metadata(self.frontmatter[1:-1])
+                    self.block = None
+                elif following is None:
+                    # The frontmatter was never closed, so we convert its lines as normal text
+                    self.block = None
+                    for j in self.frontmatter:
+                        yield self.convert_text(j, classify(j))
                 else:
-                    lines[i + j - 1] = new_content[:-3] + " \\\\ \n"
+                    self.block = "frontmatter"
+                continue
 
-            lines[i + rows - 1] += "\n\\end{tabular}\n\\end{table}"
+            # Inside a fenced block the lines are written as they are
+            kind = classify(line)
 
-        elif re.search(r"[\w.\$]+[\s]*$", lines[i]):
-            lines[i] = lines[i] + " \\\\"
+            if self.block == "fence":
+                if kind == "fence":
+                    self.block = None
+                    yield "\\end{verbatim}\n"
+                else:
+                    yield line + "\n"
+                continue
+
+            if self.block == "math":
+                # Empty lines are not allowed inside a math environment, so we skip them
+                if line == "":
+                    continue
+                if kind == "math":
+                    self.block = None
+                    # If the line before is an align environment we drop the "$$"
+                    if classify(self.previous) != "align":
+                        yield rewrite_math(line.replace("$$", "") + "\\]") + "\n"
+                else:
+                    yield self.convert_line(line, math=True)
+                self.previous = line
+                continue
+
+            if self.block == "align":
+                # An align environment outside of "$$" is math as well and ends with its \end
+                if line == "":
+                    continue
+                if kind == "align" and line.startswith("\\end"):
+                    self.block = None
+                yield self.convert_line(line, math=True)
+                self.previous = line
+                continue
+
+            if self.block in ("table_head", "table"):
+                if self.block == "table_head":
+                    # We read the alignment of the columns from the markers and skip them
+                    self.table_alignment_spec = table_alignment(line)
+                    self.table_rows = []
+                else:
+                    row = self.convert_row(line) + " \\\\ \n"
+                    if self.table_rows is None:
+                        yield row
+                    else:
+                        self.table_rows.append(row)
+                        if len(self.table_rows) > self.longtable_rows:
+                            # The table is too long for a float, so we start a longtable and stream the rows from now on
+                            # The header row is repeated on every page
+                            yield longtable_start + self.table_alignment_spec + "}\n\n"
+                            yield self.table_head + "\\endhead\n"
+                            yield from self.table_rows
+                            self.table_rows = None
+
+                # The table ends when the next line is no longer a table row
+                # We write it as a float if its rows are still kept or else close the longtable
+                if is_table_row(following):
+                    self.block = "table"
+                else:
+                    self.block = None
+                    if self.table_rows is None:
+                        yield longtable_end + "\n"
+                    else:
+                        yield table_start + self.table_alignment_spec + "}\n\n" + self.table_head + "".join(
+                            self.table_rows
+                        )
+                        yield table_end + "\n"
+                self.previous = line
+                continue
+
+            if kind == "fence":
+                self.block = "fence"
+                yield "\\begin{verbatim}\n"
+
+            elif kind == "math":
+                if line.count("$$") > 1 and len(line.strip()) > 4:
+                    # The whole math environment is written on one line
+                    yield rewrite_math("\\[" + line.replace("$$", "") + "\\]") + "\n"
+                else:
+                    self.block = "math"
+                    # If the line after is an align environment we drop the "$$"
+                    if classify(following) != "align":
+                        yield rewrite_math("\\[" + line.replace("$$", "")) + "\n"
+
+            elif kind == "align":
+                if line.startswith("\\begin"):
+                    self.block = "align"
+                yield self.convert_line(line, math=True)
+
+            elif kind == "embed" and embedded_note(line) is not None:
+                # Without a vault the embedded note stays as text, but the section is still not cached
+                # Otherwise it would be used as text after a vault is set
+                self.embed_count += 1
+                if self.embed is None:
+                    yield self.convert_text(line, kind)
+                else:
+                    name, heading = embedded_note(line)
+                    yield self.embed(name, heading, self.convert_text(line, kind))
 
-        # These before were mutually exclusive, this is why we used elif
+            elif "|" in line and is_table_comp_point(following):
+                # The line is the header of a table and the line after it contains the alignment markers
+                self.block = "table_head"
+                self.table_head = self.convert_row(line) + " \\\\ \n\\hline\n"
+
+            else:
+                yield self.convert_text(line, kind)
+
+            self.previous = line
+
+    def read_metadata(self, lines):
+        # We write the relevant metadata to the dictionary
+        for i in lines:
+            key, _, value = i.partition(": ")
+            if key in important_metadata:
+                self.metadata[key] = value
+
+    def convert_text(self, line, kind):
+        # If the line is a header we replace the "#" with the corresponding "\section{}"
+        # Without a table of contents the sections are not numbered
+        if kind in header_commands:
+            command, marker = header_commands[kind]
+            star = "" if self.behavior["table_of_contents"] else "*"
+            line = "\\" + command + star + "{" + line.replace(marker, "") + "}"
+            return rewrite_inline(line, math_spans(line)) + "\n"
+
+        if kind is not None:
+            return self.convert_line(line)
+
+        # A bold or italic text which is still open at the end of the paragraph is closed, so the LaTeX stays balanced
+        # The paragraph ends before an empty line, a header, a block or a table
+        following = self.following
+        ends = following is None or not following.strip() or classify(following) is not None or "|" in following
+        self.emphasis[2] = not ends
+        chunk = self.convert_line(line, emphasis=self.emphasis)
+        if ends and (self.emphasis[0] or self.emphasis[1]):
+            chunk = chunk[:-1] + "}" * (self.emphasis[0] + self.emphasis[1]) + "\n"
+            self.emphasis[:2] = [False, False]
+        return chunk
+
+    def convert_line(self, line, math=False, emphasis=None):
+        if needs_line_break(line):
+            line = line + " \\\\"
+
+        # Images and drawings are embedded with "[[", so most lines don't have to be searched for them
+        embeds = "[[" in line
 
         # Check if the line is an image
-        if lines.has_image(i):
+        if embeds and image_pattern.search(line):
             # We get the names of the image files and remove everything after the file extension
+            # The images are staged without their folders, so like the drawings they are included by their file name
             for j in image_formats:
-                if j in lines[i]:
-                    image_names.append(lines[i].split("[[")[1].split(j)[0] + j)
+                if j in line:
+                    name = line.split("[[")[1].split(j)[0] + j
+                    self.image_names.append(name)
+                    line = line.replace("[[" + name, "[[" + name.split("/")[-1], 1)
 
             # If the line is an image we replace the "![" with the corresponding "\\includegraphics{}"
-            lines[i] = lines[i].replace("![[", "\\begin{figure}[H]\n\\includegraphics[width=0.5\\textwidth]{", 1)
-            lines[i] = re.sub(r"(\|.*)*\]\]", "}\\n\\\\centering\\n\\\\end{figure}", lines[i], 1)
+            line = line.replace("![[", figure_start, 1)
+            line = image_end_pattern.sub(lambda match: figure_end, line, 1)
 
         # Check if the line is an excalidraw
-        if lines.has_excalidraw(i):
+        if embeds and excalidraw_pattern.search(line):
             # We get the names of the drawings and remove everything before the last "/" and after the file extension
-            drawing_names.append(lines[i].split("[[")[1].split("/")[-1].split(".excalidraw")[0] + ".excalidraw.md")
+            self.drawing_names.append(line.split("[[")[1].split("/")[-1].split(".excalidraw")[0] + ".excalidraw.md")
 
             # If the line is an excalidraw we replace the "![" with the corresponding "\\includegraphics{}"
-            lines[i] = re.sub(
-                r"\!\[\[.*\/", "\\\\begin{figure}[H]\\n\\\\includegraphics[width=0.5\\\\textwidth]{", lines[i], 1
-            )
-            lines[i] = re.sub(r"\]\]", ".svg.png}\\n\\\\centering\\n\\\\end{figure}", lines[i], 1)
-
-        if lines.is_chem(i):
-            lines[i] = lines[i].replace("->", " -> ")
-
-    # We ckeck if between the first and last id of the align and math environments are an empty line
-    # If there is an empty line we add its index to the del_index list
-    for i in id_to_check:
-        for j in range(i[0], i[1]):
-            if lines[j] == "":
-                del_index.append(j)
-
-    # We replace & with \\& in the lines that are not between the first and last id of the align and math environments
-    for index, i in enumerate(id_to_check):
-        if index == 0:
-            for j in range(0, i[0]):
-                lines[j] = re.sub(r"[^\\]&", r"\\&", lines[j], 0, re.MULTILINE)
+            line = excalidraw_start_pattern.sub(lambda match: figure_start, line, 1)
+            line = excalidraw_end_pattern.sub(lambda match: ".svg.png" + figure_end, line, 1)
+
+        if "\\ce" in line:
+            line = line.replace("->", " -> ")
+
+        # A line inside a math environment is math as a whole, otherwise we look for the inline math
+        return rewrite_inline(line, [(0, len(line))] if math else math_spans(line), emphasis) + "\n"
+
+    def convert_row(self, line):
+        # We replace multipels of whitespace with a single whitespace and rewrite the row before splitting the cells
+        # The & in the cells are escaped, so the & which separate the cells are added afterwards
+        line = whitespace_pattern.sub(" ", line)
+        return " & ".join(rewrite_inline(line, math_spans(line)).split("|")[1:-1])
+
+
+class SectionCache:
+    """This keeps the LaTeX of the sections of a note between conversions.
+
+    Only the sections which were used by the last conversion are saved, so the file doesn't grow with every edit.
+    """
+
+    version = 1
+
+    def __init__(self, path, behavior):
+        self.path = Path(path)
+        self.options = json.dumps(behavior, sort_keys=True, default=str)
+        self.sections = {}
+        self.used = {}
+        self.reused = 0
+
+    def load(self):
+        # A missing or broken file only means that every section is converted
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+            if data["version"] == self.version and data["converter_version"] == converter_version:
+                self.sections = data["sections"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.sections = {}
+        return self
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + "." + temp_suffix())
+        with open(temp_path, "w") as file:
+            json.dump({"version": self.version, "converter_version": converter_version, "sections": self.used}, file)
+        os.replace(temp_path, self.path)
+
+    def key(self, pairs, first):
+        # The key contains the lines of the section, the line after it and if it is at the start of the note
+        digest = hashlib.sha256((self.options + str(first)).encode())
+        for line, _ in pairs:
+            digest.update(line.encode() + b"\n")
+        following = pairs[-1][1]
+        digest.update(b"\0" if following is None else following.encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        entry = self.sections.get(key)
+        if entry is not None:
+            self.used[key] = entry
+            self.reused += 1
+        return entry
+
+    def put(self, key, entry):
+        self.used[key] = entry
+
+
+class Transcluder:
+    """This converts the notes which are embedded with ![[Note]] or ![[Note#Heading]].
+
+    Every note is converted to parts, which are LaTeX and the embeds inside of it. The parts are stored in the
+    cache with the hash of the note, so a note is only parsed again when it changed, and the embeds are expanded
+    when the note is used. Within a conversion every embedded note is expanded only once.
+    """
+
+    def __init__(self, vault_path, behavior, cache_path=None, root=None, vault_index=None):
+        self.vault_index = vault_index if vault_index is not None else get_vault_index(vault_path)
+        self.behavior = behavior
+        self.cache_path = Path(cache_path) if cache_path is not None else get_cache_dir() / "fragments"
+        self.fragments = {}
+
+        # The stack holds the notes which are being expanded, starting with the converted note itself
+        self.stack = [(str(Path(root).resolve()), "")] if root is not None else []
+        self.parsed = 0
+        self.image_names = []
+        self.drawing_names = []
+        self.dependencies = []
+        self.missing = []
+
+    def __call__(self, name, heading, text):
+        # We return the converted note or the line as text if the note can't be embedded
+        path = self.vault_index.find_first(name)
+        if path is None:
+            print(f"The note '{name}' was not found in the vault.")
+            self.missing.append(name)
+            return text
+
+        # A note which embeds itself, directly or through other notes, would never end
+        key = (str(path), heading)
+        if key in self.stack:
+            print(f"The note '{name}' embeds itself, so it is not embedded again.")
+            return text
+
+        if key not in self.fragments:
+            self.stack.append(key)
+            try:
+                parts = self.parts(path, heading)
+                self.fragments[key] = "".join(i if isinstance(i, str) else self(*i) for i in parts)
+            finally:
+                self.stack.pop()
+        return self.fragments[key]
+
+    def parts(self, path, heading):
+        # The parts depend on the content of the note, the heading and the conversion
+        data = path.read_bytes()
+        digest = hashlib.sha256(converter_version.encode())
+        digest.update(json.dumps([self.behavior, heading], sort_keys=True, default=str).encode())
+        digest.update(data)
+        fragment_path = self.cache_path / (digest.hexdigest() + ".json")
+        self.dependencies.append(path)
+
+        # A fragment which is used again is marked as recently used, so that pruning the cache keeps it
+        try:
+            with open(fragment_path) as file:
+                fragment = json.load(file)
+            os.utime(fragment_path)
+        except (OSError, ValueError):
+            fragment = self.convert(data.decode(), heading)
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+            temp_path = fragment_path.with_name(fragment_path.name + "." + temp_suffix())
+            with open(temp_path, "w") as file:
+                json.dump(fragment, file)
+            os.replace(temp_path, fragment_path)
+
+        self.image_names += fragment["image_names"]
+        self.drawing_names += fragment["drawing_names"]
+        return fragment["parts"]
+
+    def convert(self, text, heading):
+        # We convert the note and keep its embeds as lists of the name, the heading and the line as text
+        self.parsed += 1
+        lines = text.splitlines()
+        if heading:
+            lines = heading_section(lines, heading)
+            if not lines:
+                print(f"The heading '{heading}' was not found.")
+        stream = ConversionStream(lines, self.behavior, lambda *embed: list(embed))
+
+        parts = []
+        latex = []
+        for i in stream:
+            if isinstance(i, str):
+                latex.append(i)
+            else:
+                parts += ["".join(latex), i]
+                latex = []
+        parts.append("".join(latex))
+        return {"parts": parts, "image_names": stream.image_names, "drawing_names": stream.drawing_names}
+
+
+def convert(text, behavior):
+    # We stream the lines of the text through the conversion and join the chunks to a string that will be returned
+    stream = ConversionStream((text + "\n").split("\n"), behavior)
+    output = "".join(stream)
+
+    # We return the output string, the metadata dictionary and the lists of image and drawing names
+    return output, stream.metadata, stream.image_names, stream.drawing_names
+
+
+class CancelledError(Exception):
+    """This is raised when a conversion was cancelled."""
+
+
+class Job:
+    """This tracks the progress of a conversion and allows to cancel it.
+
+    The programs that are started for the conversion are registered with the job, so that cancelling
+    kills them together with their own child processes. Every stage and program is recorded as a span
+    with its duration, which can be written as a Chrome trace.
+    """
+
+    def __init__(self, progress=None, trace_memory=False):
+        self.progress = progress
+        self.trace_memory = trace_memory
+        self.cancelled = False
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, python=False, **args):
+        # We record the start and the duration of the span, the body can add values like byte counts to args
+        # For the stages in Python the peak of the memory can be recorded as well
+        measure_memory = python and self.trace_memory
+        if measure_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            duration = time.perf_counter_ns() - start
+            if measure_memory:
+                args["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+            self.spans.append((name, start, duration, threading.get_ident(), args))
+
+    def durations(self):
+        # We add up the durations of the spans with the same name in seconds
+        durations = {}
+        for name, _, duration, _, _ in self.spans:
+            durations[name] = durations.get(name, 0) + duration / 1e9
+        return durations
+
+    def trace_events(self, pid=None):
+        # We convert the spans to complete events of the Chrome trace format, the times are in microseconds
+        pid = os.getpid() if pid is None else pid
+        return [
+            {"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000, "pid": pid, "tid": tid, "args": args}
+            for name, start, duration, tid, args in self.spans
+        ]
+
+    def write_trace(self, path, events=None):
+        # The trace can be opened in chrome://tracing or https://ui.perfetto.dev
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.trace_events() if events is None else events}, file, default=str)
+
+    def stage(self, name):
+        # We report the stage the conversion reached, unless it was cancelled
+        self.check()
+        if self.progress is not None:
+            self.progress(name)
+
+    def check(self):
+        if self.cancelled:
+            raise CancelledError("The conversion was cancelled")
+
+    def add_process(self, process):
+        with self.lock:
+            self.processes.add(process)
+            if self.cancelled:
+                kill_process_tree(process)
+
+    def remove_process(self, process):
+        with self.lock:
+            self.processes.discard(process)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            for i in self.processes:
+                kill_process_tree(i)
+
+
+def start_process(args, **kwargs):
+    # Every program gets its own process group, so that it can be killed together with its children
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(args, **kwargs)
+
+
+def kill_process_tree(process):
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        process.kill()
+
+
+def run_process(args, cwd=None, timeout=None, job=None):
+    if job is None:
+        job = Job()
+
+    # We run the program and wait until it is finished, a program that takes too long is killed
+    with job.span(Path(args[0]).name, command=args) as span:
+        process = start_process(args, cwd=cwd)
+        job.add_process(process)
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(process)
+            process.wait()
+            span["timeout"] = True
+            raise
+        finally:
+            job.remove_process(process)
+            span["exit_code"] = process.returncode
+
+    # A program that was killed because the job was cancelled is not an error of the program
+    job.check()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args)
+
+
+def temp_suffix():
+    # Temporary files get the ids of the process and the thread, so that parallel conversions never collide
+    return f"{os.getpid()}.{threading.get_ident()}"
+
+
+def get_cache_dir():
+    # platformdirs is only needed for the persistent caches, so we import it when they are used
+    import platformdirs
+
+    return Path(platformdirs.user_cache_dir(appname=appname, appauthor=appauthor, ensure_exists=True))
+
+
+class VaultIndex:
+    """This maps the names of all files in a vault to their paths.
+
+    Like in Obsidian the names are found regardless of their case. The index is stored in the cache directory
+    and refreshed incrementally: only directories whose modification time changed since the last refresh are
+    listed again.
+    """
+
+    version = 1
+
+    def __init__(self, vault_path, cache_path=None):
+        self.vault_path = Path(vault_path).resolve()
+        if cache_path is None:
+            vault_hash = hashlib.sha1(str(self.vault_path).encode()).hexdigest()[:16]
+            cache_path = get_cache_dir() / ("vault_index_" + vault_hash + ".json")
+        self.cache_path = Path(cache_path)
+
+        # We store for every directory relative to the vault its mtime, its files and its subdirectories
+        self.directories = {}
+        self.files = {}
+
+        self.load()
+
+    def load(self):
+        # We read the stored index if it exists and was written by the same version
+        try:
+            with open(self.cache_path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == self.version and data.get("vault_path") == str(self.vault_path):
+            self.directories = data["directories"]
+
+    def save(self):
+        # We write the index to a temporary file first, so that a crash never leaves a broken index behind
+        data = {"version": self.version, "vault_path": str(self.vault_path), "directories": self.directories}
+        # Several processes can refresh the index at the same time, so every process uses its own temporary file
+        temp_path = self.cache_path.with_suffix(f".{temp_suffix()}.tmp")
+        with open(temp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.cache_path)
+
+    def refresh(self):
+        directories = {}
+        changed = False
+
+        # We walk through the directories of the vault, but only list the ones that changed
+        pending = [""]
+        while pending:
+            relative = pending.pop()
+            try:
+                mtime = os.stat(self.vault_path / relative).st_mtime_ns
+            except OSError:
+                changed = True
+                continue
+
+            cached = self.directories.get(relative)
+            if cached is not None and cached[0] == mtime:
+                entry = cached
+            else:
+                changed = True
+                files = []
+                subdirectories = []
+                try:
+                    with os.scandir(self.vault_path / relative) as iterator:
+                        for i in iterator:
+                            if i.is_dir(follow_symlinks=False):
+                                subdirectories.append(i.name)
+                            else:
+                                files.append(i.name)
+                except OSError:
+                    continue
+                entry = [mtime, files, subdirectories]
+
+            directories[relative] = entry
+            for i in entry[2]:
+                pending.append(relative + "/" + i if relative else i)
+
+        # Directories which no longer exist are dropped as well
+        if changed or len(directories) != len(self.directories):
+            self.directories = directories
+            self.save()
+
+        # We map the names of the files to their paths, a vault which didn't change keeps its map
+        # Obsidian finds the files regardless of their case, so the names are casefolded
+        if changed or not self.files:
+            files = {}
+            for relative in sorted(self.directories):
+                for i in self.directories[relative][1]:
+                    files.setdefault(i.casefold(), []).append(self.vault_path / relative / i)
+            self.files = files
+
+        return self
+
+    def find(self, name):
+        # We look the name up and keep only the paths that end with the folders given in the name
+        # If files only differ in their case, the ones with the exact name come first
+        parts = Path(name).parts
+        if not parts:
+            return []
+        folded = [i.casefold() for i in parts]
+        paths = [i for i in self.files.get(folded[-1], []) if [j.casefold() for j in i.parts[-len(parts) :]] == folded]
+        return sorted(paths, key=lambda i: i.parts[-len(parts) :] != parts)
+
+    def find_first(self, name):
+        paths = self.find(name)
+        return paths[0] if paths else None
+
+    def directories_with(self, extensions):
+        # We return the directories which contain files with one of the extensions, for example the images
+        extensions = tuple(extensions)
+        directories = {}
+        for name, paths in self.files.items():
+            if name.endswith(extensions):
+                for i in paths:
+                    directories[i.parent] = None
+        return sorted(directories)
+
+
+# We keep the indexes of the vaults, so that they stay warm between conversions
+# Conversions on several threads refresh them one after the other
+vault_indexes = {}
+vault_index_lock = threading.Lock()
+
+
+def get_vault_index(vault_path):
+    vault_path = Path(vault_path).resolve()
+    with vault_index_lock:
+        if vault_path not in vault_indexes:
+            vault_indexes[vault_path] = VaultIndex(vault_path)
+        return vault_indexes[vault_path].refresh()
+
+
+def hash_file(path):
+    # We hash the file in blocks, so that large attachments are never read into memory at once
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """This stores the generated .tex and .pdf files of a conversion, keyed by everything they depend on.
+
+    An entry is only used if the attachments of the note are unchanged. When the cache grows beyond
+    its size the least recently used entries are deleted.
+    """
+
+    # These options don't change the generated files, so they are not part of the key
+    ignored_behavior = [
+        "table_of_contents",
+        "store_attachments",
+        "use_result_cache",
+        "result_cache_size",
+        "sync_attachments_hash",
+        "build_cache_size",
+    ]
+
+    def __init__(self, path=None, max_size=512 * 1024 * 1024):
+        self.path = Path(path) if path is not None else get_cache_dir() / "results"
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def key(self, string_input, behavior):
+        digest = hashlib.sha256(converter_version.encode())
+
+        # The note and the template are hashed with their content
+        for i in ["in_path", "template_path"]:
+            digest.update(hash_file(string_input[i]).encode())
+
+        # The behavior and the variables are hashed with their values
+        options = {key: value for key, value in behavior.items() if key not in self.ignored_behavior}
+        variables = {key: string_input[key] for key in ["file_name", "author", "date", "vault_path"]}
+
+        # A document with \\today changes every day, so the day is part of the key
+        with open(string_input["template_path"], "rb") as file:
+            if "\\today" in string_input["date"] or b"\\today" in file.read():
+                variables["today"] = time.strftime("%Y-%m-%d")
+        digest.update(json.dumps([options, variables], sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def lookup(self, key, vault_path=None):
+        # We read the manifest of the entry if it exists
+        entry = self.path / key
+        try:
+            with open(entry / "manifest.json") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        # The entry is only valid if the attachments didn't change
+        for path, (size, mtime, digest) in manifest["dependencies"].items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime) and hash_file(path) != digest:
+                return None
+
+        # The notes and images which were not found in the vault could have been created since
+        missing = manifest.get("missing", [])
+        if missing:
+            if not vault_path or not str(vault_path).strip():
+                return None
+            vault_index = get_vault_index(vault_path)
+            if any(vault_index.find_first(i) is not None for i in missing):
+                return None
+
+        # We mark the entry as recently used
+        os.utime(entry / "manifest.json")
+        manifest["path"] = entry
+        return manifest
+
+    def store(self, key, dependencies, tex_path, pdf_path, missing=()):
+        # We write the entry to a temporary folder first, so that a half written entry is never used
+        entry = self.path / key
+        temp_entry = Path(tempfile.mkdtemp(dir=self.path))
+        shutil.copy(tex_path, temp_entry / "document.tex")
+        shutil.copy(pdf_path, temp_entry / "document.pdf")
+
+        manifest = {"file_name": Path(pdf_path).stem, "dependencies": {}, "missing": list(dict.fromkeys(missing))}
+        for i in dict.fromkeys(dependencies):
+            stat = os.stat(i)
+            manifest["dependencies"][str(i)] = [stat.st_size, stat.st_mtime_ns, hash_file(i)]
+        with open(temp_entry / "manifest.json", "w") as file:
+            json.dump(manifest, file)
+
+        if entry.exists():
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(temp_entry, entry)
+        except OSError:
+            # Another process stored the same entry at the same time
+            shutil.rmtree(temp_entry, ignore_errors=True)
+
+        self.evict()
+
+    def publish(self, manifest, out_path):
+        # We copy the cached files to the output directory
+        out_path = Path(out_path)
+        for folder, suffix in [(".TeX", ".tex"), (".pdf", ".pdf")]:
+            os.makedirs(out_path / folder, exist_ok=True)
+            shutil.copy(manifest["path"] / ("document" + suffix), out_path / folder / (manifest["file_name"] + suffix))
+        return out_path / ".pdf" / (manifest["file_name"] + ".pdf")
+
+    def evict(self):
+        # We get the size and the last use of every entry
+        entries = []
+        for i in self.path.iterdir():
+            try:
+                last_used = os.stat(i / "manifest.json").st_mtime_ns
+                size = sum(j.stat().st_size for j in i.iterdir())
+            except OSError:
+                continue
+            entries.append((last_used, size, i))
+
+        # We delete the least recently used entries until the cache is small enough
+        total = sum(i[1] for i in entries)
+        for _, size, i in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(i, ignore_errors=True)
+            total -= size
+
+
+def get_result_cache(behavior):
+    # The size of the cache is given in megabytes
+    return ResultCache(max_size=int(behavior.get("result_cache_size", 512)) * 1024 * 1024)
+
+
+# The characters of the base64 alphabet of lz-string, which the Excalidraw plugin uses to compress the drawings
+lzstring_alphabet = {j: i for i, j in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=")}
+
+
+def decompress_lzstring(text):
+    # We decompress the text like LZString.decompressFromBase64, every character holds 6 bits
+    values = [lzstring_alphabet.get(i, 0) for i in text if not i.isspace()]
+    if not values:
+        return ""
+    position = 0
+    bit = 32
+
+    def read_bits(count):
+        nonlocal position, bit
+        bits = 0
+        for power in range(count):
+            value = values[position] if position < len(values) else 0
+            if value & bit:
+                bits |= 1 << power
+            bit >>= 1
+            if bit == 0:
+                bit = 32
+                position += 1
+        return bits
+
+    # The first entry is a character with 8 or 16 bits
+    kind = read_bits(2)
+    if kind == 2:
+        return ""
+    word = chr(read_bits(8 if kind == 0 else 16))
+    dictionary = ["", "", "", word]
+    result = [word]
+    enlarge_in = 4
+    bit_count = 3
+
+    while position < len(values):
+        code = read_bits(bit_count)
+        if code == 2:
+            break
+        if code < 2:
+            # A new character is added to the dictionary
+            dictionary.append(chr(read_bits(8 if code == 0 else 16)))
+            code = len(dictionary) - 1
+            enlarge_in -= 1
+            if enlarge_in == 0:
+                enlarge_in = 1 << bit_count
+                bit_count += 1
+
+        if code < len(dictionary):
+            entry = dictionary[code]
+        elif code == len(dictionary):
+            entry = word + word[0]
+        else:
+            raise ValueError("The compressed drawing is broken.")
+
+        result.append(entry)
+        dictionary.append(word + entry[0])
+        word = entry
+        enlarge_in -= 1
+        if enlarge_in == 0:
+            enlarge_in = 1 << bit_count
+            bit_count += 1
+
+    # lz-string works with UTF-16 code units, so characters outside of the BMP are split into surrogate pairs
+    return "".join(result).encode("utf-16-le", "surrogatepass").decode("utf-16-le")
+
+
+def extract_excalidraw(path, out_path, block_size=1024 * 1024):
+    # We stream the json part of the excalidraw file to the output file and return its hash
+    # The json can be tens of MB because of embedded images, so it is copied in blocks and never read as a whole
+    digest = hashlib.sha256()
+    with open(path, "rb") as file, open(out_path, "wb") as out:
+        # We read the markdown before the json line by line until the fence of the json
+        for line in file:
+            if line.startswith(b"```json") or line.startswith(b"```compressed-json"):
+                break
         else:
-            for j in range(id_to_check[index - 1][1], i[0]):
-                lines[j] = re.sub(r"[^\\]&", r"\\&", lines[j], 0, re.MULTILINE)
+            raise ValueError(f"'{path}' contains no Excalidraw drawing.")
+        compressed = line.startswith(b"```compressed-json")
+
+        # We copy the blocks until the closing fence, the end of a block is kept in case the fence is split
+        fence = b"\n```"
+        pending = b"\n"
+        compressed_parts = []
+        finished = False
+        while not finished:
+            block = file.read(block_size)
+            data = pending + block
+            end = data.find(fence)
+            if end != -1:
+                # The "\n" before the fence still belongs to the json
+                data = data[: end + 1]
+                finished = True
+            elif not block:
+                # A fence which is never closed ends with the file
+                finished = True
+            else:
+                split = max(len(data) - len(fence) + 1, 0)
+                data, pending = data[:split], data[split:]
+            digest.update(data)
+            if compressed:
+                compressed_parts.append(data)
+            else:
+                out.write(data)
 
-    # We loop through the list of indexes and delete the corresponding lines
-    del_index.sort()
-    del_index.reverse()
-    for i in del_index:
-        del lines[i]
+        # The compressed json is much smaller than the drawing, so we decompress it at once
+        if compressed:
+            out.write(decompress_lzstring(b"".join(compressed_parts).decode("ascii")).encode())
 
-    # We join the items of lines to a string that will be returned
-    output = ""
-    for i in lines:
-        output += i + "\n"
+    return digest.hexdigest()
 
-    # We get all ** in the text and replace them either with \\textbf{ or } depending on if it is the first or second
-    while "**" in output:
-        output = output.replace("**", "\\textbf{", 1)
-        output = output.replace("**", "}", 1)
 
-    # We get all _ in the text and replace them either with \\textit{ or } depending on if it is the first or second
-    # unless it is followed by a {
-    while "_ " in output:
-        output = re.sub(r"_([^{])", r"\\textit{\1", output, 1)
-        output = re.sub("_ ", "} ", output, 1)
+class InkscapeShell:
+    """This keeps one Inkscape process in shell mode running and converts .svg files to .png files with it.
 
-    # Replace parameter characters with the normal ones
-    output = output.replace("≤", "<=").replace("#", "\\#").replace("≥", ">=").replace("≠", "!=").replace("→", "->")
+    Inkscape takes seconds to start, so all drawings are converted by the same process. A process which
+    crashes or doesn't answer in time is killed and started again.
+    """
 
-    # Replaces \pu with the LaTeX compatible \si
-    output = output.replace("\\pu", "\\si")
+    prompt = b"> "
 
-    # Replace {align} with {align*}
-    output = output.replace("{align}", "{align*}")
+    def __init__(self, command=None, timeout=60):
+        self.command = command or [inkscape_path, "--shell"]
+        self.timeout = timeout
+        self.process = None
+        self.prompts = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        # We start inkscape and read its output on a thread, so that we can wait for the prompt with a timeout
+        self.process = start_process(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0
+        )
+        self.prompts = queue.Queue()
+        threading.Thread(target=self.read_output, args=(self.process, self.prompts), daemon=True).start()
+        self.wait_for_prompt()
+
+    def read_output(self, process, prompts):
+        # Every time inkscape shows the prompt it is ready for the next command
+        output = b""
+        for char in iter(lambda: process.stdout.read(1), b""):
+            output += char
+            if output.endswith(self.prompt):
+                prompts.put(output)
+                output = b""
+        prompts.put(None)
+
+    def wait_for_prompt(self):
+        try:
+            output = self.prompts.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Inkscape didn't answer within {self.timeout}s") from None
+        if output is None:
+            raise RuntimeError("Inkscape stopped unexpectedly")
+        return output
+
+    def stop(self):
+        # We ask inkscape to quit and kill it if it doesn't
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b"quit\n")
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def export(self, svg_path, png_path, job=None):
+        if job is None:
+            job = Job()
+        command = f"file-open:{svg_path}; export-type:png; export-filename:{png_path}; export-do; file-close\n"
+        with self.lock, job.span("inkscape", file=Path(svg_path).name):
+            # We try a second time with a new process if inkscape crashed or hung
+            for attempt in range(2):
+                process = None
+                try:
+                    if self.process is None or self.process.poll() is not None:
+                        self.start()
+                    process = self.process
+                    # While inkscape works for the job, cancelling the job kills it
+                    job.add_process(process)
+                    process.stdin.write(command.encode())
+                    self.wait_for_prompt()
+                    break
+                except (OSError, RuntimeError, TimeoutError):
+                    if self.process is not None:
+                        kill_process_tree(self.process)
+                        self.process.wait()
+                        self.process = None
+                    job.check()
+                    if attempt == 1:
+                        raise
+                finally:
+                    if process is not None:
+                        job.remove_process(process)
+
+        if not os.path.exists(png_path):
+            raise FileNotFoundError(f"Inkscape did not create '{png_path}'")
+        return png_path
+
+
+# We keep the inkscape process running, so that it only starts once per session
+# Conversions on several threads share it, so it is only created once
+inkscape_shells = []
+inkscape_shell_lock = threading.Lock()
+
+
+def get_inkscape_shell():
+    with inkscape_shell_lock:
+        if not inkscape_shells:
+            inkscape_shells.append(InkscapeShell())
+            atexit.register(inkscape_shells[0].stop)
+        return inkscape_shells[0]
+
+
+def run_excalidraw_export(names, work_dir, timeout, job=None):
+    try:
+        run_process([excalidraw_export_path] + names, cwd=work_dir, timeout=timeout, job=job)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        # If the batch crashed or hung we export the drawings one by one, so that one broken drawing doesn't stop all
+        if len(names) == 1:
+            raise
+        for i in names:
+            run_process([excalidraw_export_path, i], cwd=work_dir, timeout=timeout, job=job)
 
-    # We return the output string, the metadata dictionary and the lists of image and drawing names
-    return output, metadata, image_names, drawing_names
 
+def export_drawings(drawings, cache_path, max_workers=4, timeout=120, job=None):
+    # The thread pool is only needed for drawings, so we import it here
+    from concurrent.futures import ThreadPoolExecutor
 
-def convert_excalidraw(drawing_names, vault_path, attachment_path):
-    # Convert the vault path to a pathlib Path
-    vault_path = Path(vault_path)
+    # We export the drawings in a temporary directory next to the cache, so that the .png can be moved into it
+    work_dir = Path(tempfile.mkdtemp(dir=cache_path))
+    try:
+        # The json files are named after their hash, so that drawings with the same name don't collide
+        names = []
+        for png_path, json_path in drawings.items():
+            names.append(png_path.stem + ".excalidraw")
+            os.replace(json_path, work_dir / names[-1])
+
+        # We convert the excalidraws to .svg files using excalidraw_export
+        # Several drawings are exported by one call, the batches run at the same time
+        batches = [names[i::max_workers] for i in range(min(max_workers, len(names)))]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_excalidraw_export, i, work_dir, timeout, job) for i in batches]
+            for future in futures:
+                future.result()
+
+        # We convert the .svg files to .png files using the running inkscape
+        inkscape = get_inkscape_shell()
+        for png_path, name in zip(drawings, names):
+            inkscape.export(work_dir / (name + ".svg"), work_dir / (name + ".png"), job)
+            os.replace(work_dir / (name + ".png"), png_path)
+    finally:
+        # We delete the temporary directory with the .json and .svg files
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def convert_excalidraw(
+    drawing_names,
+    vault_path,
+    attachment_path,
+    dependencies=None,
+    max_workers=4,
+    cache_path=None,
+    job=None,
+    attachment_mode="link",
+    vault_index=None,
+    staged=None,
+    missing=None,
+):
+    if job is None:
+        job = Job()
+
+    # We get the index of the vault to find the drawings, unless the conversion already refreshed it
+    if vault_index is None:
+        vault_index = get_vault_index(vault_path)
+
+    # The exported drawings are cached with the hash of their json
+    cache_path = Path(cache_path) if cache_path is not None else get_cache_dir() / "drawings"
+    cache_path.mkdir(parents=True, exist_ok=True)
+
+    # The json parts of the drawings are extracted to a temporary directory next to the cache
+    json_dir = Path(tempfile.mkdtemp(dir=cache_path))
+    try:
+        # We search the excalidraws in the vault and extract the json part of the files
+        # A drawing which is used more than once is only converted once
+        drawings = {}
+        for i in dict.fromkeys(drawing_names):
+            j = vault_index.find_first(i)
+            if j is None:
+                print(f"The drawing '{i}' was not found in the vault.")
+                if missing is not None:
+                    missing.append(i)
+                continue
+            if dependencies is not None:
+                dependencies.append(j)
 
-    # We search the excalidraws in the vault and copy the json part of the file to the attachment path
-    for i in drawing_names:
-        for j in vault_path.rglob(i):
             new_file_name = j.name.split(".md")[0]
-            with open(j) as file:
-                content = file.read()
-                content = content.split("```json")[1].split("```")[0]
-                with open(attachment_path / new_file_name, "w") as file:
-                    file.write(content)
-
-            # We convert the excalidraws to .svg files using excalidraw_export
-            username = os.getenv("username")
-            subprocess.check_call(
-                [rf"C:\Users\{username}\AppData\Roaming\npm\excalidraw_export.cmd", new_file_name], cwd=attachment_path
-            )
-            # We convert the .svg files to .png files using inkscape
-            subprocess.check_call(
-                [r"C:\Program Files\Inkscape\bin\inkscape.exe", "--export-type=png", new_file_name + ".svg"],
-                cwd=attachment_path,
+            json_path = json_dir / (str(len(drawings)) + ".json")
+            png_path = cache_path / (extract_excalidraw(j, json_path) + ".png")
+            drawings[new_file_name] = (json_path, png_path)
+
+        # Drawings which are not in the cache are exported, drawings with the same content are only exported once
+        # A drawing from the cache is marked as recently used, so that pruning the cache keeps it
+        missing = {}
+        for json_path, png_path in drawings.values():
+            try:
+                os.utime(png_path)
+            except FileNotFoundError:
+                missing[png_path] = json_path
+
+        if missing:
+            with job.span("export_drawings", drawings=len(drawings), exported=len(missing)):
+                export_drawings(missing, cache_path, max_workers, job=job)
+    finally:
+        shutil.rmtree(json_dir, ignore_errors=True)
+
+    # We copy the exported drawings to the attachment path
+    for new_file_name, (_, png_path) in drawings.items():
+        stage_file(png_path, attachment_path / (new_file_name + ".svg.png"), attachment_mode)
+        if staged is not None:
+            staged.append(new_file_name + ".svg.png")
+
+
+# The placeholders of the templates, only the first CONTENT is replaced with the note
+template_slots = ["CONTENT", "TITLE", "AUTHOR", "ATTACHMENT_PATH", "DATE"]
+template_slot_pattern = re.compile("|".join(template_slots))
+
+
+class Template:
+    """This is a template which is parsed once into its literal text and the slots for the values."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as file:
+            text = file.read()
+
+        # If the template contains an uncommented line which creates a table of contents, the sections are numbered
+        self.table_of_contents = not re.search(r"\%[\s]*\\tableofcontents", text) and bool(
+            re.search(r"\\tableofcontents", text)
+        )
+
+        # The segments are the literal text between the slots and the names of the slots
+        self.segments = []
+        position = 0
+        has_content = False
+        for match in template_slot_pattern.finditer(text):
+            if match.group() == "CONTENT":
+                if has_content:
+                    continue
+                has_content = True
+            self.segments.append(text[position : match.start()])
+            self.segments.append(match.group())
+            position = match.end()
+        self.segments.append(text[position:])
+
+        # The preamble is the part before the first slot and \begin{document}, it is the same for every note
+        # It ends with a complete line, so it can be dumped into a format
+        preamble = self.segments[0].partition("\\begin{document}")[0]
+        preamble = preamble[: preamble.rfind("\n") + 1]
+        self.preamble = preamble if "\\documentclass" in preamble else None
+
+    def render(self, file, values, content, dump=False):
+        # Every second segment is a slot, so the values and the note are written without building the whole document
+        for index, segment in enumerate(self.segments):
+            if index == 0 and dump:
+                # With a precompiled format LaTeX skips the lines up to \endofdump
+                # Written with \csname it does nothing without the format, so the .tex file still compiles on its own
+                file.write(self.preamble + "\\csname endofdump\\endcsname\n" + segment[len(self.preamble) :])
+            elif index % 2 == 0:
+                file.write(segment)
+            elif segment == "CONTENT":
+                file.writelines(content)
+            else:
+                file.write(values[segment])
+
+
+# We keep the parsed templates with the modification time of their file
+templates = {}
+
+
+def get_template(path):
+    key = str(Path(path).resolve())
+    template = templates.get(key)
+    if template is None or template.mtime != os.stat(path).st_mtime_ns:
+        template = Template(path)
+        templates[key] = template
+    return template
+
+
+tex_version = None
+
+
+def get_tex_version():
+    # We ask pdflatex for its version once, the formats only work with the version they were built with
+    global tex_version
+    if tex_version is None:
+        try:
+            result = subprocess.run(["pdflatex", "--version"], capture_output=True, text=True, timeout=30)
+            tex_version = result.stdout.partition("\n")[0]
+        except (OSError, subprocess.SubprocessError):
+            tex_version = ""
+    return tex_version
+
+
+# The formats which couldn't be built in this run, so that we don't try them for every note
+failed_formats = set()
+
+
+def get_preamble_format(template, job=None):
+    # We dump the preamble of the template into a format, so that pdflatex doesn't load all the packages every time
+    # The format is stored in the cache with the hash of the preamble and the version of TeX
+    if template.preamble is None or not get_tex_version():
+        return None
+    key = hashlib.sha256((get_tex_version() + "\n" + template.preamble).encode()).hexdigest()[:16]
+    format_path = get_cache_dir() / "formats" / (key + ".fmt")
+    if format_path.exists():
+        return format_path
+    if key in failed_formats:
+        return None
+
+    if job is None:
+        job = Job()
+    format_path.parent.mkdir(parents=True, exist_ok=True)
+    work_dir = Path(tempfile.mkdtemp(dir=format_path.parent))
+    try:
+        # mylatexformat dumps everything up to \endofdump into the format
+        with open(work_dir / "preamble.tex", "w") as file:
+            file.write(template.preamble + "\\endofdump\n\\begin{document}\n\\end{document}\n")
+        with job.span("format", template=template.path.name):
+            run_process(
+                ["pdflatex", "-ini", "-interaction=batchmode", "-jobname=" + key, "&pdflatex", "mylatexformat.ltx"]
+                + ["preamble.tex"],
+                cwd=work_dir,
+                timeout=300,
+                job=job,
             )
+        os.replace(work_dir / (key + ".fmt"), format_path)
+        return format_path
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        print(f"The preamble of the template could not be precompiled, the note is compiled without it: {e}")
+        failed_formats.add(key)
+        return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def get_build_dir(string_input):
+    # Every note gets its own build directory, which stays the same between conversions
+    key = str(Path(string_input["in_path"]).resolve()) + "\n" + str(Path(string_input["out_path"]).resolve())
+    return get_cache_dir() / "build" / hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def directory_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for i in files:
+            try:
+                size += os.stat(os.path.join(root, i), follow_symlinks=False).st_size
+            except OSError:
+                pass
+    return size
+
+
+# The folders of the cache are pruned at most once in this time, entries used within this time are never deleted
+prune_interval = 3600
+last_pruned = {}
+
+
+def prune_cache(path, max_size, min_age=prune_interval, interval=prune_interval):
+    # We delete the least recently used entries of the folder until it is smaller than max_size
+    # An entry is used when its modification time is updated, entries used recently can belong to a running conversion
+    path = Path(path)
+    now = time.time()
+    if now - last_pruned.get(path, 0) < interval:
+        return 0
+    last_pruned[path] = now
+
+    entries = []
+    try:
+        children = list(path.iterdir())
+    except OSError:
+        return 0
+    for i in children:
+        try:
+            last_used = os.stat(i, follow_symlinks=False).st_mtime
+            size = directory_size(i) if i.is_dir() else os.path.getsize(i)
+        except OSError:
+            continue
+        entries.append((last_used, size, i))
+
+    total = sum(i[1] for i in entries)
+    removed = 0
+    for last_used, size, i in sorted(entries):
+        if total <= max_size:
+            break
+        if now - last_used < min_age:
+            continue
+        if i.is_dir():
+            shutil.rmtree(i, ignore_errors=True)
+        else:
+            with contextlib.suppress(OSError):
+                os.remove(i)
+        total -= size
+        removed += 1
+    return removed
+
+
+def prune_caches(behavior):
+    # The build directories, the exported drawings and the embedded notes are each kept below the size in megabytes
+    max_size = int(behavior.get("build_cache_size", 1024)) * 1024 * 1024
+    for i in ["build", "drawings", "fragments"]:
+        prune_cache(get_cache_dir() / i, max_size)
+
+
+# The ioctl which clones a file on Linux file systems like btrfs and xfs
+FICLONE = 0x40049409
+
+
+def reflink(source, target):
+    # The new file shares the data of the source until one of them is changed
+    import fcntl
+
+    with open(source, "rb") as source_file, open(target, "wb") as target_file:
+        fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+
+
+def stage_file(source, target, mode="link"):
+    # We put the file at the target, in the link mode without copying its content if possible
+    # A hard link only works on the same file system and a reflink only on some, otherwise we copy the file
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return "link"
+    temp_path = str(target) + ".part"
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(temp_path)
+
+    method = "copy"
+    if mode == "link":
+        try:
+            os.link(source, temp_path)
+            method = "link"
+        except OSError:
+            try:
+                reflink(source, temp_path)
+                method = "reflink"
+            except (ImportError, OSError):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(temp_path)
+    if method == "copy":
+        shutil.copy2(source, temp_path)
+
+    # The file is renamed at the end, so the target is never half written
+    os.replace(temp_path, target)
+    return method
+
+
+def is_same_file(source, target, use_hash=False):
+    # Files with the same size and modification time are the same, staged files keep the time of the source
+    try:
+        source_stat = os.stat(source)
+        target_stat = os.stat(target)
+    except OSError:
+        return False
+    if source_stat.st_size != target_stat.st_size:
+        return False
+    if source_stat.st_mtime_ns == target_stat.st_mtime_ns:
+        return True
+
+    # Network shares and FAT store the time less precisely, so files up to two seconds apart are compared by content
+    # With the hash option a file which was only touched is compared by its content and not copied again
+    close = abs(source_stat.st_mtime_ns - target_stat.st_mtime_ns) < 2_000_000_000
+    if (close or use_hash) and hash_file(source) == hash_file(target):
+        os.utime(target, ns=(target_stat.st_atime_ns, source_stat.st_mtime_ns))
+        return True
+    return False
+
+
+def sync_directory(source_path, target_path, mode="link", use_hash=False):
+    # We only stage the new and changed files and remove the files which are no longer in the source
+    # Every file is written to a temporary name and renamed, so the target never contains half written files
+    target_path = Path(target_path)
+    target_path.mkdir(parents=True, exist_ok=True)
+    names = set(os.listdir(source_path))
+    counts = {"staged": 0, "unchanged": 0, "removed": 0}
+
+    for i in sorted(names):
+        if is_same_file(Path(source_path) / i, target_path / i, use_hash):
+            counts["unchanged"] += 1
+        else:
+            stage_file(Path(source_path) / i, target_path / i, mode)
+            counts["staged"] += 1
+
+    for i in os.listdir(target_path):
+        if i not in names:
+            if os.path.isdir(target_path / i):
+                shutil.rmtree(target_path / i)
+            else:
+                os.remove(target_path / i)
+            counts["removed"] += 1
+
+    return counts
+
+
+def prune_directory(path, names):
+    # We remove the files which were not staged by this conversion, for example the images the note no longer uses
+    names = set(names)
+    removed = 0
+    for i in os.listdir(path):
+        if i not in names:
+            if os.path.isdir(Path(path) / i):
+                shutil.rmtree(Path(path) / i)
+            else:
+                os.remove(Path(path) / i)
+            removed += 1
+    return removed
 
-            # We delete the .svg files
-            os.remove(attachment_path / (new_file_name + ".svg"))
 
+def replace_if_changed(new_path, path):
+    # We only replace the file if its content changed, so that its modification time stays the same
+    if os.path.exists(path) and filecmp.cmp(new_path, path, shallow=False):
+        os.remove(new_path)
+        return False
+    os.replace(new_path, path)
+    return True
 
-def convert_MD2TeX(string_input, behavior):
+
+def convert_MD2TeX(string_input, behavior, dependencies=None, job=None, vault_index=None, staged=None, missing=None):
     in_path = Path(string_input["in_path"])
     out_path = Path(string_input["out_path"])
     file_name = string_input["file_name"]
@@ -318,107 +1856,361 @@ def convert_MD2TeX(string_input, behavior):
     template_path = Path(string_input["template_path"])
     date = string_input["date"]
     vault_path = Path(string_input["vault_path"])
+    if job is None:
+        job = Job()
+
+    # The index of the vault is refreshed once for the whole conversion
+    if vault_index is None and string_input["vault_path"].strip():
+        vault_index = get_vault_index(vault_path)
 
-    # We create a temporary directory and set it as the attachment path
-    attachment_path = Path(tempfile.mkdtemp())
+    # We use the attachment folder in the build directory of the note, so that the .tex file stays the same
+    attachment_path = get_build_dir(string_input) / "attachments"
+    attachment_path.mkdir(parents=True, exist_ok=True)
+
+    # The build directory was used now, so it is the last one to be pruned
+    os.utime(attachment_path.parent)
 
     # Creates a pathlib Path out of the output string input.
     out_path = Path(out_path)
     output_path = out_path / ".TeX"
 
-    # Creates a pathlib Path out of the template string input.
-    template_path = Path(template_path)
+    # The images are linked or copied to the attachment path, in the graphicspath mode LaTeX finds them in the vault
+    attachment_mode = behavior.get("attachment_mode", "link")
+    graphics_paths = [attachment_path]
+    if attachment_mode == "graphicspath" and vault_index is not None:
+        graphics_paths += vault_index.directories_with(image_formats)
 
-    # Gets the content of the template file and stores it in the template variable
-    with open(template_path) as template:
-        template_text = template.read()
+    # The template is only parsed again if it changed since the last conversion
+    template = get_template(template_path)
+    behavior["table_of_contents"] = template.table_of_contents
 
-    # If the tempalte conatins an uncommented line which creates a table of contents we set the behavior to true
-    if not re.search(r"\%[\s]*\\tableofcontents", template_text) and re.search(r"\\tableofcontents", template_text):
-        behavior["table_of_contents"] = True
-    else:
-        behavior["table_of_contents"] = False
-
-    # Gets the content of the input MD file and stores it in the MDtext variable
-    with open(in_path) as MD:
-        MDtext = MD.read()
+    # With a precompiled preamble bake_TeX starts pdflatex from the format of the template
+    format_path = None
+    if behavior.get("precompile_preamble", False):
+        format_path = get_preamble_format(template, job)
+    string_input["format_path"] = str(format_path) if format_path is not None else ""
 
     # Creates the output path if it doesn't exists
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-
-    # Runs the content from the MD file through the convert function to convert the syntax to a .tex compatible one
-    text, metadata, image_names, drawing_names = convert(MDtext, behavior)
-
-    # We search the images in the vault and copy them to the attachment path
-    for i in image_names:
-        for j in vault_path.rglob(i):
-            shutil.copy(j, attachment_path)
-
-    # If the metadata dictionary is not empty we override the default values
-    if behavior["override_with_metadata"]:
-        if metadata:
-            if "title" in metadata:
-                file_name = metadata["title"]
-            if "author" in metadata:
-                author = metadata["author"]
-            if "date" in metadata:
-                date = metadata["date"]
+    os.makedirs(output_path, exist_ok=True)
 
     # Creates a .tex file with the content we created
-    file_path = output_path / (file_name + ".tex")
-
-    # Replaces the content of the template file with the content we created
-    text = (
-        template_text.replace("CONTENT", text)
-        .replace("TITLE", file_name)
-        .replace("AUTHOR", author)
-        .replace("ATTACHMENT_PATH", (str(attachment_path).replace("\\", "/") + "/"))
-        .replace("DATE", date)
-    )
-
-    # Writes the content to the .tex file
-    with open(file_path, "w") as file:
-        file.write(text)
+    # The file name can change with the metadata, so we write to a temporary file first
+    temp_file_path = output_path / (file_name + ".tex.part")
+
+    # We record how long the parsing takes and how many bytes are read and written
+    with job.span("parse", python=True, input_bytes=os.path.getsize(in_path)) as span:
+        # Opens the input MD file and streams its lines through the conversion to a .tex compatible syntax
+        # Notes embedded in the note are converted through the vault
+        transcluder = None
+        if vault_index is not None:
+            transcluder = Transcluder(vault_path, behavior, root=in_path, vault_index=vault_index)
+        # In the incremental mode only the sections which changed since the last conversion are converted
+        sections = None
+        if behavior.get("incremental", False):
+            sections = SectionCache(get_build_dir(string_input) / "sections.json", behavior).load()
+
+        with open(in_path) as MD, open(temp_file_path, "w") as file:
+            stream = ConversionStream(MD, behavior, transcluder, sections)
+            chunks = iter(stream)
+
+            # The frontmatter is read with the first chunk, so afterwards the metadata is known
+            first_chunk = next(chunks, "")
+
+            # If the metadata dictionary is not empty we override the default values
+            if behavior["override_with_metadata"]:
+                if stream.metadata:
+                    if "title" in stream.metadata:
+                        file_name = stream.metadata["title"]
+                    if "author" in stream.metadata:
+                        author = stream.metadata["author"]
+                    if "date" in stream.metadata:
+                        date = stream.metadata["date"]
+
+            # We write the template with the values in its slots and the converted note in place of the content
+            values = {
+                "TITLE": file_name,
+                "AUTHOR": author,
+                "ATTACHMENT_PATH": "}{".join(str(i).replace("\\", "/") + "/" for i in graphics_paths),
+                "DATE": date,
+            }
+            template.render(file, values, itertools.chain([first_chunk], chunks), dump=format_path is not None)
+
+        span["output_bytes"] = os.path.getsize(temp_file_path)
+        if sections is not None:
+            sections.save()
+            span["reused_sections"] = sections.reused
+
+        # The images and drawings of the embedded notes are used by the note as well
+        image_names = stream.image_names
+        drawing_names = stream.drawing_names
+        if transcluder is not None:
+            image_names = image_names + transcluder.image_names
+            drawing_names = drawing_names + transcluder.drawing_names
+            span["embedded_notes"] = len(transcluder.fragments)
+            span["parsed_notes"] = transcluder.parsed
+            if dependencies is not None:
+                dependencies += transcluder.dependencies
+            if missing is not None:
+                missing += transcluder.missing
+
+    # Moves the .tex file to its final name
+    # The name can come from the metadata, so we store it for bake_TeX
+    replace_if_changed(temp_file_path, output_path / (file_name + ".tex"))
+    string_input["file_name"] = file_name
+
+    # We search the images in the vault and link or copy them to the attachment path
+    # An image which is used more than once is only staged once
+    job.stage("attachments")
+    with job.span("attachments", files=0, bytes=0) as span:
+        if image_names:
+            if vault_index is None:
+                vault_index = get_vault_index(vault_path)
+            # The images are staged with the name the note uses, which can differ in its case from the one in the vault
+            # LaTeX only finds an image in the vault under its own name, in the graphicspath mode the others are staged
+            for i in dict.fromkeys(image_names):
+                j = vault_index.find_first(i)
+                if j is not None:
+                    name = i.split("/")[-1]
+                    if attachment_mode != "graphicspath" or name != j.name:
+                        method = stage_file(j, attachment_path / name, attachment_mode)
+                        span[method] = span.get(method, 0) + 1
+                        if staged is not None:
+                            staged.append(name)
+                    span["files"] += 1
+                    span["bytes"] += os.path.getsize(j)
+                    if dependencies is not None:
+                        dependencies.append(j)
+                elif missing is not None:
+                    missing.append(i)
 
     # We return the path to the temporary folder
     return attachment_path, drawing_names
 
 
-def bake_TeX(string_input, temp_path):
-    out_path = string_input["out_path"]
+def compile_TeX(string_input, job=None, timeout=None):
+    out_path = Path(string_input["out_path"])
     file_name = string_input["file_name"]
 
-    # Creates a pathlib Path out of the output string input
-    out_path = Path(out_path)
-    try:
-        # Create a temporary directory and get its path
-        temp_dir = Path(tempfile.mkdtemp())
+    # We use the build directory of the note, so that latexmk can reuse the files of the last run
+    build_dir = get_build_dir(string_input)
+    build_dir.mkdir(parents=True, exist_ok=True)
 
-        # Copy the generated .tex file in the temporary directory
-        shutil.copy(
-            out_path / ".TeX/" / (file_name + ".tex"),
-            temp_dir / (file_name + ".tex"),
-        )
+    # Copy the generated .tex file in the build directory, unless it didn't change
+    shutil.copy(out_path / ".TeX/" / (file_name + ".tex"), build_dir / (file_name + ".tex.part"))
+    replace_if_changed(build_dir / (file_name + ".tex.part"), build_dir / (file_name + ".tex"))
+
+    # Run latexmk with the file in the build directory
+    # latexmk only reruns pdflatex if one of the files it depends on changed
+    command = ["latexmk", "-pdf", "-interaction=nonstopmode"]
+
+    # pdflatex finds the precompiled format of the preamble in the build directory
+    if string_input.get("format_path"):
+        format_path = Path(string_input["format_path"])
+        stage_file(format_path, build_dir / format_path.name)
+        command.append("-pdflatex=pdflatex -fmt=" + format_path.stem + " %O %S")
 
-        # Run pdflatex with the file in the temporary directory
-        # and make sure that pdflatex is finished before the program continuous
-        subprocess.check_call(["latexmk", "-pdf", str(temp_dir) + "/" + file_name + ".tex"], cwd=temp_dir)
-        time.sleep(1)
+    run_process(command + [file_name + ".tex"], cwd=build_dir, timeout=timeout, job=job)
 
-        # Create the output directory for the .pdf if it doesn't exists
-        if not os.path.exists(out_path / ".pdf/"):
-            os.mkdir(out_path / ".pdf/")
+    # Create the output directory for the .pdf if it doesn't exists
+    os.makedirs(out_path / ".pdf/", exist_ok=True)
 
-        # Move the new .pdf file in the output/.pdf/ directory
-        shutil.move(temp_dir / (file_name + ".pdf"), out_path / ".pdf" / (file_name + ".pdf"))
+    # Copy the new .pdf file in the output/.pdf/ directory
+    # The .pdf stays in the build directory, otherwise latexmk would build it again next time
+    part_path = out_path / ".pdf" / (file_name + ".pdf." + temp_suffix())
+    shutil.copy(build_dir / (file_name + ".pdf"), part_path)
+    os.replace(part_path, out_path / ".pdf" / (file_name + ".pdf"))
 
-        # Delete the temporary folder and its contents
-        shutil.rmtree(temp_dir)
-        shutil.rmtree(temp_path)
+    # We return the path to the new .pdf file
+    return out_path / ".pdf" / (file_name + ".pdf")
 
-        print(f"Temporary folder '{temp_dir}' has been deleted.")
+
+def bake_TeX(string_input, job=None, timeout=None):
+    # A failed compilation is printed and the note has no .pdf, a cancelled one is passed on
+    try:
+        return compile_TeX(string_input, job, timeout)
+    except CancelledError:
+        raise
+    except subprocess.TimeoutExpired:
+        print(f"An error occurred: latexmk took longer than {timeout}s")
+        return None
     except Exception as e:
         print(f"An error occurred: {e}")
-        shutil.rmtree(temp_dir)
-        shutil.rmtree(temp_path)
+        return None
+
+
+def get_latexmk_timeout(behavior):
+    # The timeout of latexmk is given in seconds, 0 means that it can take as long as it needs
+    timeout = float(behavior.get("latexmk_timeout", 0))
+    return timeout if timeout > 0 else None
+
+
+def prepare_note(string_input, behavior, job=None):
+    # We convert the note to TeX and return everything that is needed to compile and cache it
+    # If the note, the template and the attachments didn't change, the document already has the cached .pdf
+    # convert_MD2TeX stores the name of the file from the metadata, so we work on a copy of the input
+    document = {"string_input": dict(string_input), "dependencies": [], "missing": [], "key": None, "pdf_path": None}
+    string_input = document["string_input"]
+
+    # Without a job the conversion can't be cancelled and doesn't report its progress
+    if job is None:
+        job = Job()
+    job.stage("parse")
+
+    # The stored attachments would be missing with a cached result, so we don't use the cache when they are stored
+    if behavior.get("use_result_cache", False) and not behavior["store_attachments"]:
+        with job.span("result_cache") as span:
+            cache = get_result_cache(behavior)
+            document["key"] = cache.key(string_input, behavior)
+            manifest = cache.lookup(document["key"], string_input["vault_path"])
+            span["hit"] = manifest is not None
+        if manifest is not None:
+            print(f"'{string_input['in_path']}' didn't change, the cached .pdf is used.")
+            document["pdf_path"] = cache.publish(manifest, string_input["out_path"])
+            document["dependencies"] = list(manifest["dependencies"])
+            return document
+
+    # We collect the files of the vault which are used by the note and the names which were not found in it
+    dependencies = document["dependencies"]
+
+    # The index of the vault is refreshed once and used by all stages of the conversion
+    vault_index = get_vault_index(string_input["vault_path"]) if string_input["vault_path"].strip() else None
+
+    # Convert the input file to TeX
+    # We collect the names of the files staged to the attachment folder of the build directory
+    staged = []
+    temp_folder, drawing_names = convert_MD2TeX(
+        string_input, behavior, dependencies, job, vault_index, staged, document["missing"]
+    )
+
+    # If there are excalidraw drawings in the input file, convert them
+    if drawing_names:
+        job.stage("drawings")
+        with job.span("drawings", python=True, drawings=len(drawing_names)):
+            convert_excalidraw(
+                drawing_names,
+                string_input["vault_path"],
+                temp_folder,
+                dependencies,
+                job=job,
+                attachment_mode=behavior.get("attachment_mode", "link"),
+                vault_index=vault_index,
+                staged=staged,
+                missing=document["missing"],
+            )
+
+    # The attachment folder stays between conversions, so the files the note no longer uses are removed
+    prune_directory(temp_folder, staged)
+
+    # If the behavior is set to keep the last attachment files we sync them to the output path
+    # Only the files which changed are written, so a synced folder doesn't upload all of them again
+    # The stored files are always copies, a link would change the image in the vault when the stored one is edited
+    if behavior["store_attachments"]:
+        with job.span("store_attachments") as span:
+            span.update(
+                sync_directory(
+                    temp_folder,
+                    Path(string_input["out_path"]) / ".attachments",
+                    "copy",
+                    behavior.get("sync_attachments_hash", False),
+                )
+            )
+
+    # The caches of the conversions are pruned to their size
+    prune_caches(behavior)
+    return document
+
+
+def store_note(document, behavior, pdf_path):
+    # We store the new result in the cache, the .tex file is kept because bake_TeX only uses a copy of it
+    if document["key"] is not None and pdf_path is not None:
+        string_input = document["string_input"]
+        tex_path = Path(string_input["out_path"]) / ".TeX" / (string_input["file_name"] + ".tex")
+        get_result_cache(behavior).store(
+            document["key"], document["dependencies"], tex_path, pdf_path, document["missing"]
+        )
+
+
+def convert_note(string_input, behavior, job=None):
+    if job is None:
+        job = Job()
+    document = prepare_note(string_input, behavior, job)
+    if document["pdf_path"] is not None:
+        return document["pdf_path"], document["dependencies"]
+
+    job.stage("compile")
+    with job.span("compile") as span:
+        pdf_path = bake_TeX(document["string_input"], job=job, timeout=get_latexmk_timeout(behavior))
+        span["pdf_bytes"] = os.path.getsize(pdf_path) if pdf_path is not None else 0
+    store_note(document, behavior, pdf_path)
+
+    # We return the path to the .pdf file, which is None if the conversion failed, and the files the note depends on
+    return pdf_path, document["dependencies"]
+
+
+class LatexScheduler:
+    """This runs latexmk for several documents at the same time.
+
+    Every document is compiled in its own build directory with its own job, so a document which fails, is
+    cancelled or runs into its timeout doesn't stop the others. The results are returned as the documents finish.
+    """
+
+    def __init__(self, jobs=None, timeout=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.timeout = timeout
+        self.pending = queue.Queue()
+        self.finished = queue.Queue()
+        self.threads = []
+        self.submitted = 0
+        self.returned = 0
+
+    def submit(self, document, job=None):
+        # We only start as many threads as there are documents, up to the limit
+        self.pending.put((document, job or Job()))
+        self.submitted += 1
+        if len(self.threads) < min(self.jobs, self.submitted):
+            thread = threading.Thread(target=self.work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            document, job = item
+            started = time.perf_counter()
+            pdf_path = None
+            try:
+                job.stage("compile")
+                with job.span("compile") as span:
+                    pdf_path = compile_TeX(document["string_input"], job, self.timeout)
+                    span["pdf_bytes"] = os.path.getsize(pdf_path)
+                error = None
+            except CancelledError:
+                error = "cancelled"
+            except subprocess.TimeoutExpired:
+                error = f"latexmk took longer than {self.timeout}s"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            self.finished.put((document, pdf_path, error, time.perf_counter() - started, job))
+
+    def results(self, block=True):
+        # We return the results in the order they finish, without blocking only the ones that are already finished
+        while self.returned < self.submitted:
+            try:
+                result = self.finished.get(block=block)
+            except queue.Empty:
+                return
+            self.returned += 1
+            yield result
+
+    def close(self):
+        # Every thread stops after the documents which were submitted before
+        for _ in self.threads:
+            self.pending.put(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,214 @@
+"""Benchmarks for the conversion with generated Obsidian notes.
+
+Run it from the repository root, the results are written as JSON lines:
+
+    python benchmarks/benchmark.py --sizes 1K 1M 50M --output bench_output.txt
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Obsidian2LaTeX_helper  # noqa: E402
+from Obsidian2LaTeX_helper import convert, convert_MD2TeX, extract_excalidraw  # noqa: E402
+
+behavior = {
+    "override_with_metadata": True,
+    "use_current_date": True,
+    "store_attachments": False,
+    "table_of_contents": False,
+}
+
+words = (
+    "energy entropy reaction equilibrium potential field charge current voltage molecule electron orbital "
+    "velocity momentum force mass pressure volume temperature catalyst solution acid base ion lattice"
+).split()
+
+
+def parse_size(text):
+    # We read sizes like 1K, 10M or 512 as a number of bytes
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    if text[-1].upper() in units:
+        return int(float(text[:-1]) * units[text[-1].upper()])
+    return int(text)
+
+
+def sentence(rng):
+    # A sentence with some bold and italic words
+    sentence_words = rng.choices(words, k=rng.randint(6, 16))
+    if rng.random() < 0.3:
+        sentence_words[1] = "**" + sentence_words[1] + "**"
+    if rng.random() < 0.2:
+        sentence_words[3] = "_" + sentence_words[3] + "_"
+    return " ".join(sentence_words).capitalize() + "."
+
+
+def block(rng, image_names, drawing_names):
+    # We choose one of the elements of a note
+    kind = rng.choices(
+        ["header", "paragraph", "math", "align", "table", "image", "drawing", "chem"],
+        weights=[2, 10, 3, 2, 2, 1, 1, 1],
+    )[0]
+    if kind == "header":
+        return "#" * rng.randint(1, 3) + " " + " ".join(rng.choices(words, k=3)).title()
+    if kind == "paragraph":
+        return " ".join(sentence(rng) for _ in range(rng.randint(1, 5)))
+    if kind == "math":
+        variable = rng.choice(words)[0]
+        return "$$\n\\frac{\\partial " + variable + "}{\\partial t} = " + str(rng.randint(1, 99)) + "x^2\n$$"
+    if kind == "align":
+        rows = [f"{rng.choice('xyz')} &= {rng.randint(1, 9)}a + {rng.randint(1, 9)}b" for _ in range(rng.randint(2, 5))]
+        return "$$\n\\begin{align}\n" + "\n".join(rows) + "\n\\end{align}\n$$"
+    if kind == "table":
+        columns = rng.randint(2, 5)
+        rows = ["| " + " | ".join(rng.choices(words, k=columns)) + " |", "|" + "---|" * columns]
+        for _ in range(rng.randint(2, 20)):
+            rows.append("| " + " | ".join(str(rng.randint(0, 999)) for _ in range(columns)) + " |")
+        return "\n".join(rows)
+    if kind == "image":
+        return "![[" + rng.choice(image_names) + "|300]]"
+    if kind == "drawing":
+        return "![[Drawings/" + rng.choice(drawing_names) + ".excalidraw|400]]"
+    return "The reaction \\ce{2H2 + O2->2H2O} releases " + str(rng.randint(100, 999)) + " \\pu{kJ}."
+
+
+def generate_note(size, seed=0, image_count=30, drawing_count=15):
+    # We generate a note of about the given size in bytes, the same seed always gives the same note
+    rng = random.Random(seed)
+    image_names = [f"figure_{i}.png" for i in range(image_count)]
+    drawing_names = [f"sketch_{i}" for i in range(drawing_count)]
+
+    parts = ["---\ntitle: Generated lecture\nauthor: Benchmark\ndate: 2024-01-01\n---\n"]
+    length = len(parts[0])
+    while length < size:
+        parts.append(block(rng, image_names, drawing_names) + "\n\n")
+        length += len(parts[-1])
+    return "".join(parts)
+
+
+def generate_drawing(size, seed=0):
+    # We generate an excalidraw drawing whose json has about the given size in bytes
+    rng = random.Random(seed)
+    elements = []
+    length = 0
+    while length < size:
+        element = {
+            "type": rng.choice(["rectangle", "ellipse", "arrow", "text"]),
+            "x": rng.uniform(0, 1000),
+            "y": rng.uniform(0, 1000),
+            "width": rng.uniform(10, 200),
+            "height": rng.uniform(10, 200),
+            "text": " ".join(rng.choices(words, k=4)),
+        }
+        elements.append(element)
+        length += len(json.dumps(element))
+    content = json.dumps({"type": "excalidraw", "version": 2, "elements": elements}, indent=1)
+    return "---\nexcalidraw-plugin: parsed\n---\n# Drawing\n```json\n" + content + "\n```\n%%\n"
+
+
+def make_vault(path, note):
+    # We create a vault with the note, empty attachments and a template
+    (path / "Attachments").mkdir(parents=True)
+    (path / "Drawings").mkdir()
+    for i in range(30):
+        (path / "Attachments" / f"figure_{i}.png").write_bytes(b"\x89PNG")
+    (path / "note.md").write_text(note)
+    (path / "template.tex").write_text("\\title{TITLE}\n\\author{AUTHOR}\n\\date{DATE}\nATTACHMENT_PATH\nCONTENT\n")
+
+
+def measure(function):
+    # We measure the time without tracemalloc and the peak of the memory in a second run with it
+    gc.collect()
+    started = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def result(name, size, seconds, peak):
+    return {
+        "benchmark": name,
+        "bytes": size,
+        "seconds": round(seconds, 6),
+        "megabytes_per_second": round(size / 1024**2 / seconds, 3) if seconds else None,
+        "peak_memory_bytes": peak,
+        "python": platform.python_version(),
+    }
+
+
+def run(sizes, seed):
+    results = []
+    for size in sizes:
+        note = generate_note(size, seed)
+        real_size = len(note.encode())
+
+        # convert() on the text of the note
+        seconds, peak = measure(lambda: convert(note, dict(behavior)))
+        results.append(result("convert", real_size, seconds, peak))
+
+        # convert_MD2TeX on a note in a vault with attachments
+        # The build directories and the index of the vault are written to a cache in the temporary directory
+        work_dir = Path(tempfile.mkdtemp())
+        get_cache_dir = Obsidian2LaTeX_helper.get_cache_dir
+        (work_dir / "cache").mkdir()
+        Obsidian2LaTeX_helper.get_cache_dir = lambda: work_dir / "cache"
+        try:
+            make_vault(work_dir / "vault", note)
+            string_input = {
+                "in_path": str(work_dir / "vault" / "note.md"),
+                "out_path": str(work_dir / "out"),
+                "file_name": "note",
+                "author": "Benchmark",
+                "template_path": str(work_dir / "vault" / "template.tex"),
+                "date": "\\today",
+                "vault_path": str(work_dir / "vault"),
+            }
+            seconds, peak = measure(lambda: convert_MD2TeX(dict(string_input), dict(behavior)))
+            results.append(result("convert_MD2TeX", real_size, seconds, peak))
+
+            # The json extraction of an excalidraw drawing of the same size
+            drawing_path = work_dir / "vault" / "Drawings" / "large.excalidraw.md"
+            drawing_path.write_text(generate_drawing(size, seed))
+            seconds, peak = measure(lambda: extract_excalidraw(drawing_path, work_dir / "large.json"))
+            results.append(result("extract_excalidraw", drawing_path.stat().st_size, seconds, peak))
+        finally:
+            Obsidian2LaTeX_helper.get_cache_dir = get_cache_dir
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        for i in results[-3:]:
+            print(json.dumps(i), flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the conversion with generated notes.")
+    parser.add_argument("--sizes", nargs="+", default=["1K", "100K", "1M", "10M", "50M"], help="sizes of the notes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated notes")
+    parser.add_argument("--output", help="file the results are written to as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = run([parse_size(i) for i in args.sizes], args.seed)
+    if args.output:
+        with open(args.output, "w") as file:
+            for i in results:
+                file.write(json.dumps(i) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import argparse
+import glob
+import os
+import time
+from pathlib import Path
+
+from Obsidian2LaTeX_helper import (
+    Job,
+    LatexScheduler,
+    appauthor,
+    appname,
+    convert_note,
+    get_latexmk_timeout,
+    get_vault_index,
+    prepare_note,
+    store_note,
+)
+
+
+def load_config():
+    # platformdirs and tomlkit are only needed to read the config, so we import them here
+    import platformdirs
+    import tomlkit
+
+    # Get the file path for the config file and the config preset file
+    config_path = Path(platformdirs.user_config_dir(appname=appname, appauthor=appauthor, ensure_exists=True))
+    config_path = config_path / "config.toml"
+    preset_path = Path(__file__).resolve().with_name("config_preset.toml")
+
+    with open(preset_path) as preset_config_file:
+        preset_config = tomlkit.parse(preset_config_file.read())
+
+    # If no config file exists, we start with the preset
+    if os.path.exists(config_path):
+        with open(config_path) as config_file:
+            config = tomlkit.parse(config_file.read())
+        changed = False
+    else:
+        config = preset_config
+        changed = True
+
+    # If the config file has not all keys, add the missing keys
+    for key in preset_config.keys():
+        if key not in config.keys():
+            config[key] = preset_config[key]
+            changed = True
+        for subkey in preset_config[key].keys():
+            if subkey not in config[key].keys():
+                config[key][subkey] = preset_config[key][subkey]
+                changed = True
+
+    # Write the new content to the config file only once
+    if changed:
+        with open(config_path, "w") as config_file:
+            config_file.write(tomlkit.dumps(config))
+
+    return config, config_path
+
+
+def get_string_input(config, args):
+    # We copy all the values from the config dictionary which the key contains standard to the str_input dictionary
+    str_input = {}
+    for key in config.keys():
+        if "standard" in key:
+            for subkey in config[key].keys():
+                str_input[subkey] = str(config[key][subkey])
+
+    # The arguments of the command line override the values of the config file
+    for key in ["in_path", "out_path", "template_path", "vault_path", "file_name", "author", "date"]:
+        if getattr(args, key, None):
+            str_input[key] = getattr(args, key)
+
+    # If no file name is given, we use the name of the input file
+    if not str_input["file_name"]:
+        str_input["file_name"] = Path(str_input["in_path"]).stem
+
+    # If the use current date option is enabled, set the date to today
+    if config["behaviour"]["use_current_date"] and not getattr(args, "date", None):
+        str_input["date"] = "\\today"
+
+    return str_input
+
+
+def get_mtimes(paths):
+    # We get the modification times of the files, a missing file has no modification time
+    mtimes = {}
+    for i in paths:
+        try:
+            mtimes[i] = os.stat(i).st_mtime_ns
+        except OSError:
+            mtimes[i] = None
+    return mtimes
+
+
+def print_durations(job):
+    # We print how long the stages and programs took, the longest first
+    for name, seconds in sorted(job.durations().items(), key=lambda i: -i[1]):
+        print(f"  {name:<20} {seconds:8.3f}s")
+
+
+def watch_note(str_input, behavior, debounce=0.5, interval=0.2, trace_path=None, trace_memory=False):
+    # We convert the note once and remember the files it depends on
+    while True:
+        started = time.perf_counter()
+        job = Job(trace_memory=trace_memory)
+        try:
+            pdf_path, dependencies = convert_note(str_input, behavior, job)
+            seconds = time.perf_counter() - started
+            if pdf_path is None:
+                print(f"Converting '{str_input['in_path']}' failed after {seconds:.2f}s, watching for changes.")
+            else:
+                print(f"Converted '{str_input['in_path']}' in {seconds:.2f}s, watching for changes.")
+        except Exception as e:
+            # A broken note should not stop the watching, so we wait for the next change
+            print(f"An error occurred: {e}")
+            dependencies = []
+
+        # The trace of the last conversion is written, so that it can be compared with the ones before
+        if trace_path:
+            job.write_trace(trace_path)
+
+        # The note, the template and the resolved attachments are watched
+        watched = [Path(str_input["in_path"]), Path(str_input["template_path"])] + dependencies
+        mtimes = get_mtimes(watched)
+
+        # We wait until one of the files changes
+        while get_mtimes(watched) == mtimes:
+            time.sleep(interval)
+
+        # Bursts of saves are combined into one conversion, so we wait until the files stop changing
+        mtimes = get_mtimes(watched)
+        while True:
+            time.sleep(debounce)
+            new_mtimes = get_mtimes(watched)
+            if new_mtimes == mtimes:
+                break
+            mtimes = new_mtimes
+
+
+def find_notes(patterns, recursive=False):
+    # We collect the notes from files, folders and glob patterns, every note is only used once
+    notes = {}
+    for i in patterns:
+        if os.path.isdir(i):
+            paths = Path(i).rglob("*.md") if recursive else Path(i).glob("*.md")
+        else:
+            paths = [Path(j) for j in glob.glob(i, recursive=True)]
+        for j in sorted(paths):
+            # Excalidraw drawings are stored as .md files too, but they are not notes
+            if j.is_file() and not j.name.endswith(".excalidraw.md"):
+                notes[j.resolve()] = None
+    return list(notes)
+
+
+def prepare_job(str_input, behavior, trace_memory=False):
+    # We convert one note to TeX and return the document, the error if there was one, the time it took and its trace
+    started = time.perf_counter()
+    job = Job(trace_memory=trace_memory)
+    try:
+        document, error = prepare_note(str_input, behavior, job), None
+    except Exception as e:
+        document, error = None, str(e) or type(e).__name__
+    return str_input["in_path"], document, error, time.perf_counter() - started, job.trace_events()
+
+
+def print_result(in_path, error, seconds):
+    if error is None:
+        print(f"[ OK ] {in_path} ({seconds:.2f}s)")
+    else:
+        print(f"[FAIL] {in_path} ({seconds:.2f}s): {error}")
+
+
+def convert_batch(notes, str_input, behavior, jobs=None, trace_path=None, trace_memory=False):
+    # Several notes would all write into the same attachment folder, so we don't store the attachments
+    behavior = dict(behavior, store_attachments=False)
+
+    # We refresh the index of the vault once, so that the workers only have to load it
+    if str_input["vault_path"].strip():
+        get_vault_index(str_input["vault_path"])
+
+    # The process pool is only needed for batches, so we import it here
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    started = time.perf_counter()
+    results = []
+    events = []
+    prepare_seconds = {}
+
+    def collect(block):
+        # The compiled documents are printed as soon as latexmk is finished with them
+        for document, pdf_path, error, seconds, job in scheduler.results(block):
+            in_path = document["string_input"]["in_path"]
+            if error is None:
+                store_note(document, behavior, pdf_path)
+            seconds += prepare_seconds[in_path]
+            results.append((in_path, error, seconds))
+            events.extend(job.trace_events())
+            print_result(in_path, error, seconds)
+
+    # The notes are converted to TeX on several processes and every finished one is compiled right away
+    # latexmk runs in its own processes, so the scheduler only needs threads to wait for them
+    with (
+        ProcessPoolExecutor(max_workers=jobs) as executor,
+        LatexScheduler(jobs, get_latexmk_timeout(behavior)) as scheduler,
+    ):
+        # Every note gets its own input dictionary with the name of the note as the file name
+        futures = [
+            executor.submit(prepare_job, dict(str_input, in_path=str(i), file_name=i.stem), behavior, trace_memory)
+            for i in notes
+        ]
+        for future in as_completed(futures):
+            in_path, document, error, seconds, job_events = future.result()
+            events.extend(job_events)
+            prepare_seconds[in_path] = seconds
+            if error is not None or document["pdf_path"] is not None:
+                # A note that failed or is cached doesn't need to be compiled
+                results.append((in_path, error, seconds))
+                print_result(in_path, error, seconds)
+            else:
+                scheduler.submit(document, Job(trace_memory=trace_memory))
+            collect(block=False)
+        collect(block=True)
+
+    # We print a summary of the conversions
+    failures = [i for i in results if i[1] is not None]
+    print(
+        f"Converted {len(results) - len(failures)} of {len(results)} notes in {time.perf_counter() - started:.2f}s"
+        f" ({sum(i[2] for i in results):.2f}s of work), {len(failures)} failed."
+    )
+    for in_path, error, _ in failures:
+        print(f"  {in_path}: {error}")
+
+    # The events of the workers keep their process ids, so every worker gets its own row in the trace
+    if trace_path:
+        Job().write_trace(trace_path, events)
+
+    return results
+
+
+def submit_to_server(args, notes, single):
+    # The server converts the notes with its own config, only the given paths and variables are sent
+    from server import submit
+
+    # The server has its own working directory, so the paths are resolved here
+    request = {key: getattr(args, key) for key in ["out_path", "template_path", "vault_path", "author", "date"]}
+    request = {key: value for key, value in request.items() if value}
+    for key in ["out_path", "template_path", "vault_path"]:
+        if key in request:
+            request[key] = str(Path(request[key]).resolve())
+    if single:
+        request["in_path"] = str(Path(args.in_path).resolve())
+        if args.file_name:
+            request["file_name"] = args.file_name
+    else:
+        request["in_paths"] = [str(i) for i in notes]
+    results = submit(args.server, dict(request, wait=True))
+    results = [results] if single else results
+
+    for i in results:
+        if i["state"] == "done":
+            print(f"[ OK ] {i['in_path']} ({i['seconds']:.2f}s, waited {i['waited']:.2f}s)")
+        else:
+            print(f"[FAIL] {i['in_path']}: {i['error'] or i['state']}")
+    return 1 if any(i["state"] != "done" for i in results) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="Obsidian2LaTeX", description="Convert Obsidian notes to LaTeX and PDF.")
+    parser.add_argument("in_paths", nargs="*", help="input files, folders or glob patterns of notes")
+    parser.add_argument("-o", "--out", dest="out_path", help="path to the output directory")
+    parser.add_argument("-t", "--template", dest="template_path", help="path to the template file")
+    parser.add_argument("--vault", dest="vault_path", help="path to the vault directory")
+    parser.add_argument("--file-name", dest="file_name", help="name of the output file")
+    parser.add_argument("--author", help="author of the document")
+    parser.add_argument("--date", help="date of the document")
+    parser.add_argument("-w", "--watch", action="store_true", help="convert the note again whenever it changes")
+    parser.add_argument("--debounce", type=float, default=0.5, help="seconds to wait for more changes in watch mode")
+    parser.add_argument("-r", "--recursive", action="store_true", help="also convert the notes in subfolders")
+    parser.add_argument("-j", "--jobs", type=int, help="number of notes converted at the same time (default: cores)")
+    parser.add_argument("--trace", dest="trace_path", help="write the timings of the stages as a Chrome trace file")
+    parser.add_argument("--trace-memory", action="store_true", help="also record the peak memory of the stages")
+    parser.add_argument("--timeout", type=float, help="seconds after which latexmk is stopped (default: config)")
+    parser.add_argument("--server", help="send the notes to a running server (e.g. http://127.0.0.1:8765)")
+    args = parser.parse_args(argv)
+
+    # A single file is converted like in the window, everything else is converted as a batch
+    notes = find_notes(args.in_paths, args.recursive)
+    single = len(args.in_paths) == 1 and os.path.isfile(args.in_paths[0])
+    args.in_path = args.in_paths[0] if single else None
+
+    if args.server:
+        if not notes:
+            parser.error("no notes found")
+        return submit_to_server(args, notes, single)
+
+    config, _ = load_config()
+    str_input = get_string_input(config, args)
+    behavior = dict(config["behaviour"])
+    if args.timeout is not None:
+        behavior["latexmk_timeout"] = args.timeout
+
+    if args.in_paths and not single:
+        if args.watch:
+            parser.error("--watch only works with a single note")
+        if not notes:
+            parser.error("no notes found")
+        results = convert_batch(notes, str_input, behavior, args.jobs, args.trace_path, args.trace_memory)
+        return 1 if any(i[1] is not None for i in results) else 0
+
+    if not str_input["in_path"]:
+        parser.error("no input file given and no standard input file in the config")
+
+    if args.watch:
+        try:
+            watch_note(str_input, behavior, args.debounce, trace_path=args.trace_path, trace_memory=args.trace_memory)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+    else:
+        job = Job(trace_memory=args.trace_memory)
+        pdf_path, _ = convert_note(str_input, behavior, job)
+        if args.trace_path:
+            job.write_trace(args.trace_path)
+            print_durations(job)
+        return 0 if pdf_path else 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,305 @@
+import argparse
+import collections
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from cli import get_string_input, load_config
+from Obsidian2LaTeX_helper import CancelledError, Job, convert_note, get_build_dir
+
+# Interactive jobs are taken from the queue before batch jobs
+priorities = {"interactive": 0, "batch": 1}
+
+# These values of a job are sent to the clients
+public_keys = [
+    "id",
+    "in_path",
+    "priority",
+    "state",
+    "stage",
+    "error",
+    "pdf_path",
+    "submitted",
+    "started",
+    "finished",
+    "waited",
+    "seconds",
+    "durations",
+]
+
+
+class ConversionService:
+    """This converts the notes which are sent to the server on worker threads.
+
+    The vault indexes, templates, section caches and the inkscape shell stay warm between the jobs, because
+    the conversions all run in this process.
+    """
+
+    def __init__(self, config, workers=2, history=1000):
+        self.config = config
+        self.queue = queue.PriorityQueue()
+        self.jobs = {}
+        self.finished = collections.deque()
+        self.history = history
+        self.lock = threading.Lock()
+        self.note_locks = {}
+        self.counter = itertools.count()
+        self.started = time.time()
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for i in self.threads:
+            i.start()
+
+    def submit(self, request, priority="interactive"):
+        # The paths and variables of the request override the ones of the config file
+        if priority not in priorities:
+            raise ValueError(f"Unknown priority '{priority}', use one of {', '.join(priorities)}.")
+        args = argparse.Namespace(**request)
+        if not getattr(args, "in_path", None):
+            raise ValueError("The job has no in_path.")
+        str_input = get_string_input(self.config, args)
+        behavior = dict(self.config["behaviour"])
+        behavior.update(request.get("behavior", {}))
+
+        job_id = uuid.uuid4().hex[:12]
+        record = {
+            "id": job_id,
+            "in_path": str_input["in_path"],
+            "priority": priority,
+            "state": "queued",
+            "stage": None,
+            "error": None,
+            "pdf_path": None,
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "waited": None,
+            "seconds": None,
+            "durations": {},
+            "string_input": str_input,
+            "behavior": behavior,
+            "done": threading.Event(),
+        }
+        record["job"] = Job(progress=lambda stage: record.update(stage=stage))
+        with self.lock:
+            self.jobs[job_id] = record
+        self.queue.put((priorities[priority], next(self.counter), job_id))
+        return record
+
+    def work(self):
+        while True:
+            _, _, job_id = self.queue.get()
+
+            # The state is changed under the lock, so that a job which is cancelled at the same time is never started
+            # A job which waits for the lock of its note is stopped by the cancel before its first stage
+            str_input = None
+            with self.lock:
+                record = self.jobs.get(job_id)
+                if record is not None and record["state"] == "queued":
+                    record["state"] = "running"
+                    str_input = record["string_input"]
+            if str_input is None:
+                continue
+
+            # Two jobs of the same note would share its build directory, so they run one after the other
+            with self.lock:
+                note_lock = self.note_locks.setdefault(str(get_build_dir(str_input)), threading.Lock())
+
+            with note_lock:
+                record["started"] = time.time()
+                record["waited"] = record["started"] - record["submitted"]
+                try:
+                    pdf_path, _ = convert_note(str_input, record["behavior"], record["job"])
+                    record["pdf_path"] = str(pdf_path) if pdf_path else None
+                    record["error"] = None if pdf_path else "latexmk did not create a .pdf file"
+                    record["state"] = "done" if pdf_path else "failed"
+                except CancelledError:
+                    record["state"] = "cancelled"
+                except Exception as e:
+                    record["error"] = str(e) or type(e).__name__
+                    record["state"] = "failed"
+
+            record["finished"] = time.time()
+            record["seconds"] = record["finished"] - record["started"]
+            record["durations"] = record["job"].durations()
+            self.finish(record)
+
+    def finish(self, record):
+        # We only keep the last finished jobs, so that a server which runs for weeks doesn't grow
+        record["done"].set()
+        with self.lock:
+            self.finished.append(record["id"])
+            while len(self.finished) > self.history:
+                self.jobs.pop(self.finished.popleft(), None)
+
+    def get(self, job_id):
+        # A finished job can be dropped from the history at any time, then there is no record
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        # A queued job is never started, a running job is stopped with its programs
+        with self.lock:
+            record = self.jobs.get(job_id)
+            if record is None:
+                return None
+            state = record["state"]
+            if state == "queued":
+                record["state"] = "cancelled"
+                record["finished"] = time.time()
+        if state == "queued":
+            self.finish(record)
+        elif state == "running":
+            record["job"].cancel()
+        return record
+
+    def status(self):
+        # We count the jobs in every state and the queued jobs of every priority
+        with self.lock:
+            records = list(self.jobs.values())
+        states = collections.Counter(i["state"] for i in records)
+        queued = collections.Counter(i["priority"] for i in records if i["state"] == "queued")
+        seconds = [i["seconds"] for i in records if i["seconds"] is not None]
+        return {
+            "uptime": time.time() - self.started,
+            "workers": len(self.threads),
+            "queue_depth": sum(queued.values()),
+            "queued": {i: queued.get(i, 0) for i in priorities},
+            "states": dict(states),
+            "average_seconds": sum(seconds) / len(seconds) if seconds else None,
+        }
+
+
+def public(record):
+    return {key: record[key] for key in public_keys}
+
+
+def make_handler(service):
+    # The http server is only needed by the server, so we import it here
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, data, status=200):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def is_allowed(self, post=False):
+            # Web pages can send requests to the server as well, but only with an Origin header
+            # A plain form or text/plain POST needs no preflight, so jobs are only taken as application/json
+            if "Origin" in self.headers:
+                self.send_json({"error": "requests from web pages are not allowed"}, 403)
+                return False
+            content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if post and content_type != "application/json":
+                self.send_json({"error": "the request has to be application/json"}, 415)
+                return False
+            return True
+
+        def do_GET(self):
+            if not self.is_allowed():
+                return
+            parts = self.path.strip("/").split("/")
+            record = service.get(parts[1]) if len(parts) == 2 and parts[0] == "jobs" else None
+            if parts == ["status"]:
+                self.send_json(service.status())
+            elif parts == ["jobs"]:
+                with service.lock:
+                    records = list(service.jobs.values())
+                self.send_json([public(i) for i in records])
+            elif record is not None:
+                self.send_json(public(record))
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            if not self.is_allowed(post=True):
+                return
+            parts = self.path.strip("/").split("/")
+            try:
+                if parts == ["jobs"]:
+                    # A request with several notes is a batch, which waits behind the interactive jobs
+                    # Every note of a batch gets its own file name, like on the command line, so they don't overwrite
+                    request = self.read_json()
+                    wait = request.pop("wait", False)
+                    batch = "in_paths" in request
+                    if batch:
+                        in_paths = request.pop("in_paths")
+                        priority = request.pop("priority", "batch")
+                        records = [
+                            service.submit(dict(request, in_path=i, file_name=Path(i).stem), priority) for i in in_paths
+                        ]
+                    else:
+                        records = [service.submit(request, request.pop("priority", "interactive"))]
+                    if wait:
+                        for i in records:
+                            i["done"].wait()
+                    data = [public(i) for i in records]
+                    self.send_json(data if batch else data[0], 200 if wait else 202)
+                elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                    record = service.cancel(parts[1])
+                    if record is None:
+                        self.send_json({"error": "not found"}, 404)
+                    else:
+                        self.send_json(public(record))
+                else:
+                    self.send_json({"error": "not found"}, 404)
+            except (ValueError, TypeError) as e:
+                self.send_json({"error": str(e)}, 400)
+
+        def log_message(self, format, *args):
+            # We don't print a line for every request
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, workers=2):
+    from http.server import ThreadingHTTPServer
+
+    config, _ = load_config()
+    service = ConversionService(config, workers)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Converting notes on http://{host}:{port} with {workers} workers, stop with Ctrl+C.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped the server.")
+    finally:
+        server.server_close()
+
+
+def submit(url, request):
+    # We send a job to a running server and return its answer, this is used by the command line
+    import urllib.request
+
+    data = json.dumps(request).encode()
+    http_request = urllib.request.Request(
+        url.rstrip("/") + "/jobs", data=data, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(http_request) as response:
+        return json.loads(response.read())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="Obsidian2LaTeX server", description="Convert notes sent over http.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: only this computer)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=2, help="number of notes converted at the same time")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# This stands in for latexmk: a .tex file with "fail" in it exits with an error, a .tex file with only a number
+# sleeps as many seconds, and the .pdf is written with the text of the .tex file
+fake_latexmk_script = """#!{python}
+import sys, time
+name = sys.argv[-1]
+text = open(name).read()
+if "fail" in text:
+    sys.exit(1)
+try:
+    time.sleep(float(text))
+except ValueError:
+    pass
+open(name[:-4] + ".pdf", "w").write(text)
+"""
+
+
+@pytest.fixture
+def fake_latexmk(tmp_path, monkeypatch):
+    # The fake latexmk is found first on the PATH and the caches are written to the temporary directory
+    if os.name == "nt":
+        pytest.skip("the fake latexmk is a shell script")
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    (bin_path / "latexmk").write_text(fake_latexmk_script.format(python=sys.executable))
+    (bin_path / "latexmk").chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_path) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return bin_path / "latexmk"
@@ -0,0 +1,133 @@
+import os
+
+from Obsidian2LaTeX_helper import prepare_note, prune_cache, replace_if_changed, stage_file, sync_directory
+
+
+def test_replace_if_changed(tmp_path):
+    (tmp_path / "note.tex").write_text("content")
+    (tmp_path / "note.tex.part").write_text("content")
+    assert not replace_if_changed(tmp_path / "note.tex.part", tmp_path / "note.tex")
+    assert not (tmp_path / "note.tex.part").exists()
+
+    (tmp_path / "note.tex.part").write_text("new content")
+    assert replace_if_changed(tmp_path / "note.tex.part", tmp_path / "note.tex")
+    assert (tmp_path / "note.tex").read_text() == "new content"
+
+
+def test_stage_file(tmp_path):
+    (tmp_path / "plot.png").write_bytes(b"png")
+    (tmp_path / "build").mkdir()
+
+    # In the link mode the staged file is the same file as the source, linking it again does nothing
+    assert stage_file(tmp_path / "plot.png", tmp_path / "build" / "plot.png") == "link"
+    assert os.path.samefile(tmp_path / "plot.png", tmp_path / "build" / "plot.png")
+    assert stage_file(tmp_path / "plot.png", tmp_path / "build" / "plot.png") == "link"
+
+    assert stage_file(tmp_path / "plot.png", tmp_path / "build" / "copy.png", "copy") == "copy"
+    assert not os.path.samefile(tmp_path / "plot.png", tmp_path / "build" / "copy.png")
+    assert (tmp_path / "build" / "copy.png").read_bytes() == b"png"
+
+
+def test_stage_file_falls_back_to_copy(tmp_path, monkeypatch):
+    def link(source, target):
+        raise OSError("Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", link)
+    (tmp_path / "plot.png").write_bytes(b"png")
+    assert stage_file(tmp_path / "plot.png", tmp_path / "staged.png") in ("reflink", "copy")
+    assert (tmp_path / "staged.png").read_bytes() == b"png"
+    assert not (tmp_path / "staged.png.part").exists()
+
+
+def test_sync_directory(tmp_path):
+    source = tmp_path / "attachments"
+    target = tmp_path / "out" / ".attachments"
+    source.mkdir()
+    (source / "a.png").write_bytes(b"a")
+    (source / "b.png").write_bytes(b"b")
+    assert sync_directory(source, target, "copy") == {"staged": 2, "unchanged": 0, "removed": 0}
+
+    # Only the changed file is written again and the file which is no longer used is removed
+    (source / "a.png").write_bytes(b"new a")
+    os.remove(source / "b.png")
+    assert sync_directory(source, target, "copy") == {"staged": 1, "unchanged": 0, "removed": 1}
+    assert sorted(os.listdir(target)) == ["a.png"]
+    assert (target / "a.png").read_bytes() == b"new a"
+
+    # A file which was only touched is not copied with the hash option
+    os.utime(source / "a.png", ns=(1, 1))
+    assert sync_directory(source, target, "copy", use_hash=True) == {"staged": 0, "unchanged": 1, "removed": 0}
+
+    # An edit of the same size within the precision of the file system is still found by the content
+    (source / "a.png").write_bytes(b"old a")
+    os.utime(source / "a.png", ns=(1, 1_000_000_001))
+    assert sync_directory(source, target, "copy") == {"staged": 1, "unchanged": 0, "removed": 0}
+    assert (target / "a.png").read_bytes() == b"old a"
+
+
+def test_prepare_note_removes_unused_attachments(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "a.png").write_bytes(b"a")
+    (vault / "b.png").write_bytes(b"b")
+    (tmp_path / "template.tex").write_text("CONTENT")
+    string_input = {
+        "in_path": str(vault / "note.md"),
+        "out_path": str(tmp_path / "out"),
+        "template_path": str(tmp_path / "template.tex"),
+        "vault_path": str(vault),
+        "file_name": "note",
+        "author": "",
+        "date": "",
+    }
+    behavior = {"override_with_metadata": True, "store_attachments": True}
+
+    # An image which the note no longer uses is removed from the stored attachments
+    (vault / "note.md").write_text("![[a.png]]")
+    prepare_note(string_input, behavior)
+    (vault / "note.md").write_text("![[b.png]]")
+    prepare_note(string_input, behavior)
+    assert os.listdir(tmp_path / "out" / ".attachments") == ["b.png"]
+
+    # The stored attachments are copies even in the link mode, so editing them doesn't change the vault
+    assert not os.path.samefile(vault / "b.png", tmp_path / "out" / ".attachments" / "b.png")
+
+
+def test_prepare_note_stages_images_under_their_name_in_the_note(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    vault = tmp_path / "vault"
+    (vault / "images").mkdir(parents=True)
+    (vault / "images" / "plot.png").write_bytes(b"png")
+    (vault / "note.md").write_text("![[images/Plot.png]]")
+    (tmp_path / "template.tex").write_text("CONTENT")
+    string_input = {
+        "in_path": str(vault / "note.md"),
+        "out_path": str(tmp_path / "out"),
+        "template_path": str(tmp_path / "template.tex"),
+        "vault_path": str(vault),
+        "file_name": "note",
+        "author": "",
+        "date": "",
+    }
+    behavior = {"override_with_metadata": True, "store_attachments": True}
+
+    # The image is found regardless of its case and staged with the name the .tex file includes
+    prepare_note(string_input, behavior)
+    assert "{Plot.png}" in (tmp_path / "out" / ".TeX" / "note.tex").read_text()
+    assert os.listdir(tmp_path / "out" / ".attachments") == ["Plot.png"]
+
+
+def test_prune_cache(tmp_path):
+    # The least recently used entries are deleted until the folder is small enough
+    for index, name in enumerate(["old", "middle", "new"]):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "file").write_bytes(b"x" * 10)
+        os.utime(tmp_path / name, (index, index))
+    assert prune_cache(tmp_path, 15, min_age=0, interval=0) == 2
+    assert os.listdir(tmp_path) == ["new"]
+
+    # Entries which were used recently are kept, they can belong to a running conversion
+    (tmp_path / "recent.png").write_bytes(b"x" * 10)
+    assert prune_cache(tmp_path, 0, interval=0) == 1
+    assert os.listdir(tmp_path) == ["recent.png"]
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+import cli
+from cli import find_notes, get_mtimes, watch_note
+
+
+def test_find_notes(tmp_path):
+    (tmp_path / "Semester" / "Week 1").mkdir(parents=True)
+    (tmp_path / "Semester" / "Lecture 1.md").write_text("")
+    (tmp_path / "Semester" / "Lecture 2.md").write_text("")
+    (tmp_path / "Semester" / "sketch.excalidraw.md").write_text("")
+    (tmp_path / "Semester" / "plot.png").write_bytes(b"png")
+    (tmp_path / "Semester" / "Week 1" / "Lecture 3.md").write_text("")
+    semester = tmp_path / "Semester"
+
+    # A folder gives its notes, but no drawings or other files, and only with recursive the notes of its subfolders
+    assert find_notes([str(semester)]) == [semester / "Lecture 1.md", semester / "Lecture 2.md"]
+    assert find_notes([str(semester)], recursive=True) == [
+        semester / "Lecture 1.md",
+        semester / "Lecture 2.md",
+        semester / "Week 1" / "Lecture 3.md",
+    ]
+
+    # Glob patterns are expanded and a note which is found twice is only used once
+    notes = find_notes([str(semester / "**" / "Lecture*.md"), str(semester / "Lecture 1.md")])
+    assert notes == [semester / "Lecture 1.md", semester / "Lecture 2.md", semester / "Week 1" / "Lecture 3.md"]
+    assert find_notes([str(semester / "*.txt")]) == []
+
+
+def test_convert_batch_reports_failures(tmp_path, monkeypatch, capsys, fake_latexmk):
+    # The config is read from the temporary directory
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "first.md").write_text("The first note.")
+    (vault / "second.md").write_text("The second note.")
+    (tmp_path / "template.tex").write_text("CONTENT")
+    args = ["--out", str(tmp_path / "out"), "--template", str(tmp_path / "template.tex"), "--vault", str(vault)]
+
+    # Every note gets its own .pdf and the summary counts them
+    assert cli.main([str(vault), "--jobs", "2"] + args) == 0
+    output = capsys.readouterr().out
+    assert "Converted 2 of 2 notes" in output and "0 failed" in output
+    assert sorted(os.listdir(tmp_path / "out" / ".pdf")) == ["first.pdf", "second.pdf"]
+    assert "The second note." in (tmp_path / "out" / ".pdf" / "second.pdf").read_text()
+
+    # A note which fails doesn't stop the others, but it is reported and the exit code is not zero
+    (vault / "second.md").write_text("This note will fail.")
+    assert cli.main([str(vault), "--jobs", "2"] + args) == 1
+    output = capsys.readouterr().out
+    assert f"[FAIL] {vault / 'second.md'}" in output
+    assert "Converted 1 of 2 notes" in output and "1 failed" in output
+    assert f"  {vault / 'second.md'}: " in output
+
+
+def test_get_mtimes(tmp_path):
+    (tmp_path / "note.md").write_text("")
+    os.utime(tmp_path / "note.md", ns=(5, 5))
+    assert get_mtimes([tmp_path / "note.md", tmp_path / "missing.md"]) == {
+        tmp_path / "note.md": 5,
+        tmp_path / "missing.md": None,
+    }
+
+
+def test_watch_note_rebuilds_once_after_a_burst_of_changes(tmp_path, monkeypatch):
+    for i in ["note.md", "template.tex", "plot.png"]:
+        (tmp_path / i).write_text("")
+        os.utime(tmp_path / i, ns=(1, 1))
+    str_input = {"in_path": str(tmp_path / "note.md"), "template_path": str(tmp_path / "template.tex")}
+
+    # The conversion depends on the image, the watching is stopped at the second conversion
+    runs = []
+
+    def convert_note(str_input, behavior, job):
+        runs.append(len(sleeps))
+        if len(runs) == 2:
+            raise KeyboardInterrupt
+        return tmp_path / "note.pdf", [tmp_path / "plot.png"]
+
+    # The image is saved twice in a row while the watch loop sleeps
+    sleeps = []
+    changes = {2: 10, 3: 20}
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) in changes:
+            os.utime(tmp_path / "plot.png", ns=(1, changes[len(sleeps)]))
+
+    monkeypatch.setattr(cli, "convert_note", convert_note)
+    monkeypatch.setattr(cli.time, "sleep", sleep)
+    with pytest.raises(KeyboardInterrupt):
+        watch_note(str_input, {}, debounce=0.5, interval=0.2)
+
+    # The loop polls until the image changes, waits until the saves stop and then converts the note only once
+    assert runs == [0, 4]
+    assert sleeps == [0.2, 0.2, 0.5, 0.5]
@@ -1,4 +1,4 @@
-from Obsidian2LaTeX_helper import convert
+from Obsidian2LaTeX_helper import ConversionStream, SectionCache, classify, convert, math_spans
 
 behavior = {
     "override_with_metadata": True,
@@ -48,3 +48,131 @@ def test_convert_italic():
     expected_latex = "\\section*{Heading}\n\nSome \\textit{italic} text. \\\\\n"
     converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
     assert converted == expected_latex or converted == expected_latex + "\n"
+
+
+def test_convert_emphasis_across_lines():
+    # The bold and italic text go on in the next line, an unfinished one is closed at the end of the paragraph
+    obsidian_text = "Some **bold\nacross** and _italic\nacross_ lines.\nOpen **bold\n\nNext."
+    expected_latex = (
+        "Some \\textbf{bold \\\\\nacross} and \\textit{italic \\\\\nacross} lines. \\\\\n"
+        "Open \\textbf{bold \\\\}\n\nNext. \\\\\n"
+    )
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert converted == expected_latex or converted == expected_latex + "\n"
+
+
+def test_convert_metadata():
+    obsidian_text = "---\ntitle: Lecture\nauthor: Me\ntags: physics\n---\n# Heading"
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert converted.startswith("\\section*{Heading}\n")
+    assert metadata == {"title": "Lecture", "author": "Me"}
+
+
+def test_convert_table():
+    obsidian_text = "| a | b |\n|---|---|\n| 1 & 2 | 3 |\n\nMore text."
+    expected_latex = "\\begin{table}[H]\n\\centering\n\\begin{tabular}{c|c}\n\n a  &  b  \\\\ \n\\hline\n 1 \\& 2  &  3  \\\\ \n\n\\end{tabular}\n\\end{table}\n\nMore text. \\\\\n"  # noqa: E501
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert converted == expected_latex or converted == expected_latex + "\n"
+
+
+def test_convert_fenced_block():
+    obsidian_text = "```python\nx_1 = **kwargs\n```\nSome **bold**."
+    expected_latex = "\\begin{verbatim}\nx_1 = **kwargs\n\\end{verbatim}\nSome \\textbf{bold}. \\\\\n"
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert converted == expected_latex or converted == expected_latex + "\n"
+
+
+def test_convert_symbols():
+    obsidian_text = "Some α ≤ β #tag"
+    expected_latex = "Some \\ensuremath{\\alpha} <= \\ensuremath{\\beta} \\#tag \\\\\n"
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert converted == expected_latex or converted == expected_latex + "\n"
+
+
+def test_classify():
+    assert classify("# Heading") == "header"
+    assert classify("## Heading") == "subheader"
+    assert classify("#### Heading") == "subsubheader"
+    assert classify("\\begin{gather*}") == "align"
+    assert classify("\\begin{tabular}") is None
+    assert classify("$$") == "math"
+    assert classify("```python") == "fence"
+    assert classify("Some text") is None
+    assert classify("") is None
+
+
+def test_convert_mentioned_image_format():
+    converted, metadata, image_names, drawing_names = convert("Save it as .png file", behavior)
+    assert converted == "Save it as .png file \\\\\n\n"
+    assert image_names == []
+
+
+def test_convert_table_alignment():
+    obsidian_text = "| a | b | c |\n|:---|:---:|---:|\n| 1 | 2 | 3 |"
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert "\\begin{tabular}{l|c|r}" in converted
+
+
+def test_convert_longtable():
+    rows = "\n".join(f"| {i} | {i * i} |" for i in range(10))
+    obsidian_text = "| n | square |\n|---|---|\n" + rows + "\n\nMore text."
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, dict(behavior, longtable_rows=5))
+    assert converted.startswith(
+        "\\begin{longtable}{c|c}\n\n n  &  square  \\\\ \n\\hline\n\\endhead\n 0  &  0  \\\\ \n"
+    )
+    assert converted.count(" \\\\ \n") == 11
+    assert "\\end{longtable}\n\nMore text." in converted
+    assert "\\begin{table}" not in converted
+
+
+def test_math_spans():
+    assert math_spans("no math") == []
+    assert math_spans("a $x$ b $$y$$ c \\$5") == [(2, 5), (8, 13)]
+
+
+def test_convert_inline_math_is_not_escaped():
+    obsidian_text = "Text & _it_ $a_1 & b_ 2 ≤ c$ #tag"
+    expected_latex = "Text \\& \\textit{it} $a_1 & b_ 2 \\leq  c$ \\#tag \\\\\n"
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert converted == expected_latex or converted == expected_latex + "\n"
+
+
+def test_convert_align_without_dollars():
+    obsidian_text = "\\begin{align}\na_1 &= b_ 2\n\\end{align}"
+    expected_latex = "\\begin{align*}\na_1 &= b_ 2 \\\\\n\\end{align*}\n"
+    converted, metadata, image_names, drawing_names = convert(obsidian_text, behavior)
+    assert converted == expected_latex or converted == expected_latex + "\n"
+
+
+def test_convert_incremental_sections(tmp_path):
+    def convert_incremental(text):
+        sections = SectionCache(tmp_path / "sections.json", behavior).load()
+        converted = "".join(ConversionStream((text + "\n").split("\n"), behavior, sections=sections))
+        sections.save()
+        return converted, sections.reused
+
+    # The math block crosses the second header, so these two sections are always converted together
+    lines = ["---", "title: T", "---", "# One", "Text _a_.", "$$", "# not a header", "$$", "# Two", "| a |", "|---|"]
+    lines += ["| 1 |", "# Three", "End."]
+    text = "\n".join(lines)
+    assert convert_incremental(text) == (convert(text, behavior)[0], 0)
+    assert convert_incremental(text)[1] == 3
+
+    text = text.replace("End.", "Changed end.")
+    converted, reused = convert_incremental(text)
+    assert converted == convert(text, behavior)[0]
+    assert reused == 2
+
+
+def test_convert_incremental_sections_with_embeds(tmp_path):
+    # A section with an embedded note is converted every time, so setting a vault later transcludes the note
+    text = "# One\n![[Sub]]\n# Two\nText.\n"
+    sections = SectionCache(tmp_path / "sections.json", behavior).load()
+    "".join(ConversionStream(text.split("\n"), behavior, sections=sections))
+    sections.save()
+
+    sections = SectionCache(tmp_path / "sections.json", behavior).load()
+    embed = lambda name, heading, line: "EMBEDDED " + name + "\n"  # noqa: E731
+    converted = "".join(ConversionStream(text.split("\n"), behavior, embed, sections))
+    assert "EMBEDDED Sub" in converted
+    assert sections.reused == 1
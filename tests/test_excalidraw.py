@@ -0,0 +1,85 @@
+import hashlib
+import os
+import sys
+
+from Obsidian2LaTeX_helper import InkscapeShell, convert_excalidraw, extract_excalidraw
+
+drawing = '# Excalidraw Data\n\n%%\n# Drawing\n```json\n{"type": "excalidraw"}\n```\n%%\n'
+
+
+def test_extract_excalidraw(tmp_path):
+    (tmp_path / "sketch.excalidraw.md").write_text(drawing)
+    # A small block size splits the closing fence between two blocks
+    digest = extract_excalidraw(tmp_path / "sketch.excalidraw.md", tmp_path / "sketch.json", block_size=5)
+    assert (tmp_path / "sketch.json").read_bytes() == b'\n{"type": "excalidraw"}\n'
+    assert digest == hashlib.sha256(b'\n{"type": "excalidraw"}\n').hexdigest()
+
+
+def test_extract_compressed_excalidraw(tmp_path):
+    # The plugin compresses the json with lz-string and breaks it into several lines
+    compressed = "N4IgLgngDgpiBcACEMAeBjAhgGwJYBMAnTAdxAF8g==="
+    text = "# Drawing\n```compressed-json\n" + compressed[:20] + "\n\n" + compressed[20:] + "\n```\n%%\n"
+    (tmp_path / "sketch.excalidraw.md").write_text(text)
+    extract_excalidraw(tmp_path / "sketch.excalidraw.md", tmp_path / "sketch.json")
+    assert (tmp_path / "sketch.json").read_text() == '{"type": "excalidraw"}'
+
+
+def test_convert_excalidraw_cached(tmp_path, monkeypatch):
+    # The index of the vault is stored in the cache, which is kept out of the real one
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "user_cache"))
+    vault = tmp_path / "vault"
+    (vault / "drawings").mkdir(parents=True)
+    (vault / "drawings" / "sketch.excalidraw.md").write_text(drawing)
+    (vault / "drawings" / "copy.excalidraw.md").write_text(drawing)
+    (tmp_path / "attachments").mkdir()
+
+    # A drawing whose json is already in the cache is not exported again
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    json_hash = hashlib.sha256(b'\n{"type": "excalidraw"}\n').hexdigest()
+    (cache / (json_hash + ".png")).write_bytes(b"png")
+    os.utime(cache / (json_hash + ".png"), (0, 0))
+
+    dependencies = []
+    drawing_names = ["sketch.excalidraw.md", "copy.excalidraw.md", "sketch.excalidraw.md"]
+    convert_excalidraw(drawing_names, vault, tmp_path / "attachments", dependencies, cache_path=cache)
+    assert (tmp_path / "attachments" / "sketch.excalidraw.svg.png").read_bytes() == b"png"
+    assert (tmp_path / "attachments" / "copy.excalidraw.svg.png").read_bytes() == b"png"
+    assert len(dependencies) == 2
+
+    # The cached drawing was used, so it is the last one to be pruned
+    assert os.path.getmtime(cache / (json_hash + ".png")) > 0
+
+
+fake_inkscape = """
+import sys
+from pathlib import Path
+
+sys.stdout.write("Inkscape interactive shell mode.\\n> ")
+sys.stdout.flush()
+for line in sys.stdin:
+    if line.startswith("quit"):
+        break
+    actions = dict(i.strip().partition(":")[::2] for i in line.split(";"))
+    # The first export of a drawing called crash makes the process crash
+    if "crash" in actions["file-open"] and not Path(actions["file-open"] + ".crashed").exists():
+        Path(actions["file-open"] + ".crashed").touch()
+        sys.exit(1)
+    Path(actions["export-filename"]).write_bytes(b"png")
+    sys.stdout.write("> ")
+    sys.stdout.flush()
+"""
+
+
+def test_inkscape_shell_restarts_after_crash(tmp_path):
+    (tmp_path / "inkscape.py").write_text(fake_inkscape)
+    shell = InkscapeShell([sys.executable, str(tmp_path / "inkscape.py")], timeout=10)
+    try:
+        shell.export(tmp_path / "first.svg", tmp_path / "first.png")
+        first_process = shell.process
+        shell.export(tmp_path / "crash.svg", tmp_path / "crash.png")
+        assert shell.process is not first_process
+        assert (tmp_path / "first.png").exists()
+        assert (tmp_path / "crash.png").exists()
+    finally:
+        shell.stop()
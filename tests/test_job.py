@@ -0,0 +1,47 @@
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from Obsidian2LaTeX_helper import CancelledError, Job, run_process
+
+
+def test_job_reports_stages():
+    stages = []
+    job = Job(progress=stages.append)
+    job.stage("parse")
+    job.stage("compile")
+    assert stages == ["parse", "compile"]
+
+
+def test_job_cancel_kills_process():
+    job = Job()
+    threading.Timer(0.2, job.cancel).start()
+    started = time.perf_counter()
+    with pytest.raises(CancelledError):
+        run_process([sys.executable, "-c", "import time; time.sleep(30)"], job=job)
+    assert time.perf_counter() - started < 10
+
+    # After cancelling no further stage is started
+    with pytest.raises(CancelledError):
+        job.stage("compile")
+
+
+def test_job_writes_trace(tmp_path):
+    job = Job(trace_memory=True)
+    with job.span("parse", python=True, input_bytes=10) as span:
+        span["output_bytes"] = 20
+    run_process([sys.executable, "-c", "pass"], job=job)
+
+    trace_path = tmp_path / "trace.json"
+    job.write_trace(trace_path)
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert [i["name"] for i in events] == ["parse", Path(sys.executable).name]
+    assert events[0]["ph"] == "X"
+    assert events[0]["args"]["output_bytes"] == 20
+    assert "peak_memory_bytes" in events[0]["args"]
+    assert events[1]["args"]["exit_code"] == 0
+    assert set(job.durations()) == {"parse", Path(sys.executable).name}
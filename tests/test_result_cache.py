@@ -0,0 +1,90 @@
+import time
+
+from Obsidian2LaTeX_helper import ResultCache
+
+behavior = {
+    "override_with_metadata": True,
+    "use_current_date": True,
+    "store_attachments": False,
+    "table_of_contents": False,
+}
+
+
+def make_note(tmp_path):
+    (tmp_path / "note.md").write_text("# Heading")
+    (tmp_path / "template.tex").write_text("CONTENT")
+    (tmp_path / "image.png").write_bytes(b"png")
+    (tmp_path / "out").mkdir()
+    (tmp_path / "document.tex").write_text("tex")
+    (tmp_path / "document.pdf").write_bytes(b"pdf")
+    return {
+        "in_path": str(tmp_path / "note.md"),
+        "template_path": str(tmp_path / "template.tex"),
+        "out_path": str(tmp_path / "out"),
+        "file_name": "note",
+        "author": "Me",
+        "date": "\\today",
+        "vault_path": str(tmp_path),
+    }
+
+
+def test_result_cache_hit(tmp_path):
+    string_input = make_note(tmp_path)
+    cache = ResultCache(tmp_path / "cache")
+    key = cache.key(string_input, behavior)
+    assert cache.lookup(key) is None
+
+    cache.store(key, [tmp_path / "image.png"], tmp_path / "document.tex", tmp_path / "document.pdf")
+    manifest = cache.lookup(cache.key(string_input, dict(behavior, table_of_contents=True)))
+    assert manifest is not None
+    assert cache.publish(manifest, string_input["out_path"]).read_bytes() == b"pdf"
+
+
+def test_result_cache_miss_on_changes(tmp_path):
+    string_input = make_note(tmp_path)
+    cache = ResultCache(tmp_path / "cache")
+    key = cache.key(string_input, behavior)
+    cache.store(key, [tmp_path / "image.png"], tmp_path / "document.tex", tmp_path / "document.pdf")
+
+    # A changed attachment invalidates the entry
+    (tmp_path / "image.png").write_bytes(b"new png")
+    assert cache.lookup(key) is None
+
+    # A changed note or variable changes the key
+    (tmp_path / "note.md").write_text("# Other heading")
+    assert cache.key(string_input, behavior) != key
+    assert cache.key(dict(string_input, author="You"), behavior) != key
+
+
+def test_result_cache_miss_when_a_missing_file_is_created(tmp_path, monkeypatch):
+    # An embedded note which was missing in the vault invalidates the entry once it is created
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "user_cache"))
+    string_input = make_note(tmp_path)
+    cache = ResultCache(tmp_path / "cache")
+    key = cache.key(string_input, behavior)
+    cache.store(key, [], tmp_path / "document.tex", tmp_path / "document.pdf", ["Electron.md"])
+    assert cache.lookup(key, string_input["vault_path"]) is not None
+    assert cache.lookup(key) is None
+
+    (tmp_path / "Electron.md").write_text("An electron.")
+    assert cache.lookup(key, string_input["vault_path"]) is None
+
+
+def test_result_cache_eviction(tmp_path):
+    string_input = make_note(tmp_path)
+    cache = ResultCache(tmp_path / "cache", max_size=1)
+    key = cache.key(string_input, behavior)
+    cache.store(key, [], tmp_path / "document.tex", tmp_path / "document.pdf")
+    assert cache.lookup(key) is None
+
+
+def test_result_cache_key_changes_with_the_day(tmp_path, monkeypatch):
+    # A document with \today is built again on the next day, a fixed date is not
+    string_input = make_note(tmp_path)
+    cache = ResultCache(tmp_path / "cache")
+    key = cache.key(string_input, behavior)
+    fixed_key = cache.key(dict(string_input, date="1. May"), behavior)
+
+    monkeypatch.setattr(time, "strftime", lambda format: "2000-01-02")
+    assert cache.key(string_input, behavior) != key
+    assert cache.key(dict(string_input, date="1. May"), behavior) == fixed_key
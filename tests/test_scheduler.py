@@ -0,0 +1,26 @@
+import time
+
+from Obsidian2LaTeX_helper import LatexScheduler
+
+
+def test_scheduler_runs_documents_in_parallel(tmp_path, fake_latexmk):
+    # Every document has its own output and build directory
+    documents = []
+    for name, text in [("slow", "1.5"), ("fail", "fail"), ("hang", "30"), ("fast", "0.5")]:
+        out_path = tmp_path / name
+        (out_path / ".TeX").mkdir(parents=True)
+        (out_path / ".TeX" / (name + ".tex")).write_text(text)
+        string_input = {"in_path": str(tmp_path / (name + ".md")), "out_path": str(out_path), "file_name": name}
+        documents.append({"string_input": string_input})
+
+    started = time.perf_counter()
+    with LatexScheduler(jobs=4, timeout=3) as scheduler:
+        for i in documents:
+            scheduler.submit(i)
+        results = [(i[0]["string_input"]["file_name"], i[1], i[2]) for i in scheduler.results()]
+
+    # The documents finish in their own order and the failed ones don't stop the others
+    assert [i[0] for i in results] == ["fail", "fast", "slow", "hang"]
+    assert results[1][1] == tmp_path / "fast" / ".pdf" / "fast.pdf"
+    assert results[0][2] and "longer than 3" in results[3][2]
+    assert time.perf_counter() - started < 10
@@ -0,0 +1,135 @@
+import json
+import threading
+import tomllib
+from pathlib import Path
+
+import pytest
+
+from server import ConversionService, make_handler
+
+preset_path = Path(__file__).resolve().parent.parent / "config_preset.toml"
+
+
+def make_service():
+    # Without workers the jobs stay in the queue, so we can look at its order
+    with open(preset_path, "rb") as file:
+        return ConversionService(tomllib.load(file), workers=0)
+
+
+def test_interactive_jobs_are_taken_first(tmp_path):
+    service = make_service()
+    batch = [service.submit({"in_path": str(tmp_path / f"{i}.md")}, "batch") for i in range(3)]
+    interactive = service.submit({"in_path": str(tmp_path / "Note.md"), "author": "Me"})
+
+    order = [service.queue.get()[2] for _ in range(4)]
+    assert order == [interactive["id"]] + [i["id"] for i in batch]
+    assert interactive["string_input"]["author"] == "Me"
+    assert interactive["string_input"]["file_name"] == "Note"
+
+
+def test_status_and_cancel(tmp_path):
+    service = make_service()
+    service.submit({"in_path": str(tmp_path / "a.md")}, "batch")
+    record = service.submit({"in_path": str(tmp_path / "b.md"), "behavior": {"incremental": False}})
+    assert record["behavior"]["incremental"] is False
+
+    status = service.status()
+    assert status["queue_depth"] == 2
+    assert status["queued"] == {"interactive": 1, "batch": 1}
+
+    # A cancelled job is finished right away and is skipped by the workers
+    service.cancel(record["id"])
+    assert record["done"].is_set()
+    assert service.status()["states"] == {"queued": 1, "cancelled": 1}
+
+    with pytest.raises(ValueError):
+        service.submit({"in_path": str(tmp_path / "c.md")}, "urgent")
+    with pytest.raises(ValueError):
+        service.submit({})
+
+
+def request(url, path, data=None, headers=None):
+    # We send a request to the server and return the status and the answer
+    import urllib.error
+    import urllib.request
+
+    body = json.dumps(data).encode() if data is not None else None
+    http_request = urllib.request.Request(url + path, data=body, headers=headers or {})
+    try:
+        with urllib.request.urlopen(http_request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_server_runs_jobs_through_the_handler(tmp_path, monkeypatch):
+    from http.server import ThreadingHTTPServer
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    with open(preset_path, "rb") as file:
+        service = ConversionService(tomllib.load(file), workers=2)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    json_headers = {"Content-Type": "application/json"}
+
+    try:
+        # A job with a missing template fails on the worker, the server keeps running
+        job = {"in_path": str(tmp_path / "note.md"), "template_path": str(tmp_path / "missing.tex"), "wait": True}
+        (tmp_path / "note.md").write_text("# Note")
+        status, answer = request(url, "/jobs", job, json_headers)
+        assert status == 200
+        assert answer["state"] == "failed" and "missing.tex" in answer["error"]
+        assert request(url, "/jobs/" + answer["id"])[1]["state"] == "failed"
+
+        # Requests of web pages and requests which are not json are rejected
+        assert request(url, "/jobs", job, {"Content-Type": "text/plain"})[0] == 415
+        assert request(url, "/jobs", job, dict(json_headers, Origin="https://example.com"))[0] == 403
+        assert request(url, "/status", headers={"Origin": "https://example.com"})[0] == 403
+
+        # Jobs which are cancelled while the workers take them are finished only once
+        batch = {"in_paths": [str(tmp_path / f"{i}.md") for i in range(20)], "template_path": job["template_path"]}
+        status, answer = request(url, "/jobs", batch, json_headers)
+        assert status == 202 and len(answer) == 20
+        for i in answer:
+            request(url, f"/jobs/{i['id']}/cancel", {}, json_headers)
+        for i in answer:
+            service.jobs[i["id"]]["done"].wait(10)
+        assert len(service.finished) == len(set(service.finished)) == 21
+        assert request(url, "/status")[1]["queue_depth"] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_server_batch_notes_keep_their_names(tmp_path, fake_latexmk):
+    from http.server import ThreadingHTTPServer
+
+    # With a standard file name every note of a batch still gets its own .pdf
+    with open(preset_path, "rb") as file:
+        config = tomllib.load(file)
+    config["standard_variables"]["file_name"] = "Notes"
+    service = ConversionService(config, workers=2)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    (tmp_path / "template.tex").write_text("CONTENT")
+    (tmp_path / "a.md").write_text("Note a")
+    (tmp_path / "b.md").write_text("Note b")
+    batch = {
+        "in_paths": [str(tmp_path / "a.md"), str(tmp_path / "b.md")],
+        "out_path": str(tmp_path / "out"),
+        "template_path": str(tmp_path / "template.tex"),
+        "wait": True,
+    }
+    try:
+        status, answer = request(url, "/jobs", batch, {"Content-Type": "application/json"})
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert status == 200
+    assert sorted(i["pdf_path"] for i in answer) == [str(tmp_path / "out" / ".pdf" / i) for i in ["a.pdf", "b.pdf"]]
+    assert "Note a" in (tmp_path / "out" / ".pdf" / "a.pdf").read_text()
+    assert "Note b" in (tmp_path / "out" / ".pdf" / "b.pdf").read_text()
@@ -0,0 +1,32 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# These modules are only needed by the window or when a conversion runs
+heavy_modules = ["PySide6", "tomlkit", "platformdirs", "concurrent.futures", "multiprocessing"]
+
+measure_import = """
+import json
+import sys
+import time
+
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": [i for i in {heavy_modules} if i in sys.modules]}}))
+"""
+
+
+def measure(module):
+    # We import the module in a fresh interpreter and measure how long it takes
+    code = measure_import.format(module=module, heavy_modules=heavy_modules)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1])
+    return json.loads(output)
+
+
+def test_core_starts_without_heavy_modules():
+    for module in ["Obsidian2LaTeX_helper", "cli", "main"]:
+        result = measure(module)
+        assert result["modules"] == [], f"{module} imports {result['modules']} at start-up"
+        assert result["seconds"] < 1.0, f"{module} took {result['seconds']:.3f}s to import"
@@ -0,0 +1,37 @@
+import io
+import os
+
+from Obsidian2LaTeX_helper import get_template
+
+
+def test_template_render(tmp_path):
+    (tmp_path / "template.tex").write_text("\\title{TITLE}\n%\\tableofcontents\nCONTENT\n\\date{DATE} CONTENT\n")
+    template = get_template(tmp_path / "template.tex")
+    assert not template.table_of_contents
+
+    # Placeholders in the note are not replaced and only the first CONTENT is the note
+    file = io.StringIO()
+    template.render(file, {"TITLE": "Note", "DATE": "today"}, ["TITLE ", "DATE"])
+    assert file.getvalue() == "\\title{Note}\n%\\tableofcontents\nTITLE DATE\n\\date{today} CONTENT\n"
+    assert get_template(tmp_path / "template.tex") is template
+
+    # A changed template is parsed again
+    (tmp_path / "template.tex").write_text("\\tableofcontents\nCONTENT")
+    os.utime(tmp_path / "template.tex", ns=(1, 1))
+    assert get_template(tmp_path / "template.tex").table_of_contents
+
+
+def test_template_preamble(tmp_path):
+    text = (
+        "\\documentclass{article}\n\\usepackage{amsmath}\n\\title{TITLE}\n\\begin{document}\nCONTENT\n\\end{document}\n"
+    )
+    (tmp_path / "template.tex").write_text(text)
+    template = get_template(tmp_path / "template.tex")
+    assert template.preamble == "\\documentclass{article}\n\\usepackage{amsmath}\n"
+
+    # With a format the part which changes between notes comes after \endofdump
+    file = io.StringIO()
+    template.render(file, {"TITLE": "Note"}, ["Text"], dump=True)
+    assert file.getvalue().startswith(
+        "\\documentclass{article}\n\\usepackage{amsmath}\n\\csname endofdump\\endcsname\n\\title{Note}"
+    )
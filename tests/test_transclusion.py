@@ -0,0 +1,51 @@
+from Obsidian2LaTeX_helper import ConversionStream, Transcluder, embedded_note
+
+behavior = {
+    "override_with_metadata": True,
+    "use_current_date": True,
+    "store_attachments": False,
+    "table_of_contents": False,
+}
+
+
+def convert_with_embeds(text, transcluder):
+    stream = ConversionStream(text.split("\n"), behavior, transcluder)
+    return "".join(stream)
+
+
+def test_embedded_note():
+    assert embedded_note("![[Atom]]") == ("Atom.md", "")
+    assert embedded_note("![[Physics/Atom#Model|Alias]]") == ("Physics/Atom.md", "Model")
+    assert embedded_note("![[plot.png]]") is None
+    assert embedded_note("![[sketch.excalidraw]]") is None
+
+
+def test_transclusion(tmp_path, monkeypatch):
+    # The index of the vault is stored in the cache, which is kept out of the real one
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    (vault / "Atom.md").write_text(
+        "---\ntags: atom\n---\nAn atom.\n![[Electron]]\n# Model\nThe model.\n# Other\nOther."
+    )
+    (vault / "Electron.md").write_text("An electron.\n![[Atom]]\n![[plot.png]]")
+
+    transcluder = Transcluder(vault, behavior, cache_path=tmp_path / "fragments")
+    converted = convert_with_embeds("![[Atom]]\n![[Atom#Model]]\n![[Atom]]\n![[Missing]]", transcluder)
+
+    # The electron embeds the atom again, which stays a link instead of an endless loop
+    atom = "An atom. \\\\\nAn electron. \\\\\n![[Atom]]\n\\begin{figure}[H]"
+    assert converted.startswith(atom)
+    # The section of a heading ends before the next heading
+    assert "Other. \\\\\n\\section*{Model}\nThe model. \\\\\nAn atom." in converted
+    assert converted.endswith("![[Missing]]\n")
+    assert transcluder.image_names == ["plot.png"]
+    assert transcluder.missing == ["Missing.md"]
+    assert transcluder.parsed == 3
+
+    # In the next run only the changed note is parsed again
+    (vault / "Electron.md").write_text("A changed electron.")
+    transcluder = Transcluder(vault, behavior, cache_path=tmp_path / "fragments")
+    converted = convert_with_embeds("![[Atom]]", transcluder)
+    assert converted.startswith("An atom. \\\\\nA changed electron. \\\\\n")
+    assert transcluder.parsed == 1
@@ -0,0 +1,35 @@
+import os
+
+from Obsidian2LaTeX_helper import VaultIndex
+
+
+def test_vault_index_find(tmp_path):
+    vault = tmp_path / "vault"
+    (vault / "attachments" / "physics").mkdir(parents=True)
+    (vault / "attachments" / "physics" / "plot.png").write_bytes(b"png")
+    (vault / "note.md").write_text("# Note")
+
+    index = VaultIndex(vault, cache_path=tmp_path / "index.json").refresh()
+    assert index.find("plot.png") == [vault.resolve() / "attachments" / "physics" / "plot.png"]
+    assert index.find("physics/plot.png") == index.find("plot.png")
+    assert index.find("chemistry/plot.png") == []
+    assert index.find("Physics/Plot.PNG") == index.find("plot.png")
+    assert index.find_first("missing.png") is None
+    assert index.directories_with([".png"]) == [vault.resolve() / "attachments" / "physics"]
+
+
+def test_vault_index_refresh(tmp_path):
+    vault = tmp_path / "vault"
+    (vault / "drawings").mkdir(parents=True)
+    index = VaultIndex(vault, cache_path=tmp_path / "index.json").refresh()
+    assert index.find_first("sketch.excalidraw.md") is None
+
+    # A new file changes the mtime of its directory, so the index picks it up
+    (vault / "drawings" / "sketch.excalidraw.md").write_text("drawing")
+    os.utime(vault / "drawings", ns=(1, 1))
+    index.refresh()
+    assert index.find_first("sketch.excalidraw.md") == vault.resolve() / "drawings" / "sketch.excalidraw.md"
+
+    # The stored index is loaded again without listing the vault
+    reloaded = VaultIndex(vault, cache_path=tmp_path / "index.json")
+    assert reloaded.directories == index.directories